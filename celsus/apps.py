@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CelsusConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'celsus'
+
+    def ready(self):
+        import celsus.signals
@@ -0,0 +1,384 @@
+import copy
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+from datetime import timedelta
+
+import jsonpatch
+import jsonpointer
+import orjson
+from django.core.files.base import File, ContentFile
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from celsus.downloads import send_file
+from celsus.models import Curtain, CurtainBlob, CurtainBlobSection, CurtainUpload, CurtainVersion
+
+# sessions above this size are spooled to disk while being compressed
+CURTAIN_SPOOL_SIZE = 10 * 1024 * 1024
+CURTAIN_COMPRESS_LEVEL = 6
+CURTAIN_CHUNK_SIZE = 1024 * 1024
+# a version keeps a full copy of the session every this many versions, the ones in between only keep a delta
+CURTAIN_VERSION_SNAPSHOT_INTERVAL = 10
+# chunked uploads left unfinished for longer than this are removed
+CURTAIN_UPLOAD_EXPIRY = timedelta(days=1)
+
+accepts_gzip_re = re.compile(r"\bgzip\b")
+
+
+def compress_curtain_session(uploaded_file):
+    # mtime is fixed so that the same session always compresses to the same bytes
+    spool = tempfile.SpooledTemporaryFile(max_size=CURTAIN_SPOOL_SIZE)
+    with gzip.GzipFile(fileobj=spool, mode="wb", compresslevel=CURTAIN_COMPRESS_LEVEL, mtime=0) as gz:
+        for chunk in File(uploaded_file).chunks(CURTAIN_CHUNK_SIZE):
+            gz.write(chunk)
+    spool.seek(0)
+    return File(spool)
+
+
+def hash_curtain_session(uploaded_file):
+    content_hash = hashlib.sha256()
+    size = 0
+    for chunk in File(uploaded_file).chunks(CURTAIN_CHUNK_SIZE):
+        content_hash.update(chunk)
+        size += len(chunk)
+    return content_hash.hexdigest(), size
+
+
+def get_or_create_curtain_blob(uploaded_file, content_hash=None, size=None):
+    """
+    Returns the blob holding the uploaded content. The upload is hashed first and only compressed and written
+    when no blob with the same content exists yet. An existing blob is locked so that release_curtain_blob
+    cannot delete it while it is reused, callers point the curtain at it within the same transaction.
+    """
+    if content_hash is None:
+        content_hash, size = hash_curtain_session(uploaded_file)
+    with transaction.atomic():
+        blob = CurtainBlob.objects.select_for_update().filter(content_hash=content_hash).first()
+    if blob:
+        return blob
+    uploaded_file.seek(0)
+    blob = CurtainBlob(content_hash=content_hash, size=size)
+    blob.file.save(f"{content_hash}.json.gz", compress_curtain_session(uploaded_file), save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # the same content was stored concurrently, keep that copy
+        blob.file.delete(save=False)
+        with transaction.atomic():
+            blob = CurtainBlob.objects.select_for_update().get(content_hash=content_hash)
+    else:
+        split_curtain_blob(blob)
+    return blob
+
+
+def load_curtain_blob(blob):
+    with blob.file.open("rb") as f, gzip.GzipFile(fileobj=f, mode="rb") as gz:
+        return orjson.loads(gz.read())
+
+
+def split_curtain_blob(blob):
+    """
+    Store every top level key of a session as its own compressed section so that viewers can load parts of
+    the session without downloading all of it. Sessions that are not a JSON object are left without sections.
+    """
+    try:
+        session = load_curtain_blob(blob)
+    except orjson.JSONDecodeError:
+        session = None
+    sections = []
+    if isinstance(session, dict):
+        for position, (name, value) in enumerate(session.items()):
+            content = orjson.dumps(value)
+            section = CurtainBlobSection(blob=blob, name=name, position=position, size=len(content))
+            section.file.save(
+                f"{blob.content_hash}_{position}.json.gz",
+                ContentFile(gzip.compress(content, compresslevel=CURTAIN_COMPRESS_LEVEL, mtime=0)),
+                save=False
+            )
+            sections.append(section)
+    try:
+        with transaction.atomic():
+            CurtainBlobSection.objects.bulk_create(sections)
+            CurtainBlob.objects.filter(pk=blob.pk).update(sectioned=True)
+    except IntegrityError:
+        # the blob was split concurrently, keep those sections
+        for section in sections:
+            section.file.delete(save=False)
+    blob.sectioned = True
+
+
+def ensure_curtain_blob(curtain):
+    """
+    Move a session stored before blobs existed into a blob. The curtain is locked so that concurrent requests
+    convert it once, the legacy file is only removed once the conversion is committed.
+    """
+    if curtain.blob_id:
+        return curtain.blob
+    with transaction.atomic():
+        locked = Curtain.objects.select_for_update().get(pk=curtain.pk)
+        if not locked.blob_id:
+            legacy_file = locked.file.name
+            with locked.file.storage.open(legacy_file, "rb") as f:
+                if legacy_file.endswith(".gz"):
+                    with gzip.GzipFile(fileobj=f, mode="rb") as gz:
+                        save_curtain_session(locked, gz)
+                else:
+                    save_curtain_session(locked, f)
+            transaction.on_commit(lambda: locked.file.storage.delete(legacy_file))
+    curtain.blob = locked.blob
+    curtain.file.name = locked.file.name
+    curtain.updated = locked.updated
+    return curtain.blob
+
+
+def get_curtain_sections(curtain):
+    """
+    Returns the manifest of a session. Sessions stored before blobs or sections existed are converted on first use.
+    """
+    ensure_curtain_blob(curtain)
+    if not curtain.blob.sectioned:
+        split_curtain_blob(curtain.blob)
+    return list(curtain.blob.sections.all())
+
+
+def release_curtain_blob(blob):
+    # remove a blob and its file once no curtain references it anymore
+    with transaction.atomic():
+        blob = CurtainBlob.objects.select_for_update().filter(pk=blob.pk).first()
+        if blob and not blob.curtains.exists() and not blob.versions.exists():
+            for section in blob.sections.all():
+                section.file.delete(save=False)
+            blob.file.delete(save=False)
+            blob.delete()
+
+
+def set_curtain_blob(curtain, blob, delta=None):
+    """
+    Point a curtain at a session blob and record the change as a new version. delta is the JSON Patch from the
+    previous session to this one when the caller already has it, otherwise it is computed.
+    """
+    previous_blob = curtain.blob
+    curtain.blob = blob
+    curtain.file.name = blob.file.name
+    curtain.save()
+    if previous_blob is None or previous_blob.pk != blob.pk:
+        record_curtain_version(curtain, previous_blob, blob, delta)
+        if previous_blob:
+            release_curtain_blob(previous_blob)
+
+
+def record_curtain_version(curtain, previous_blob, blob, delta=None):
+    with transaction.atomic():
+        Curtain.objects.select_for_update().filter(pk=curtain.pk).first()
+        last = curtain.versions.order_by("-version").first()
+        version = CurtainVersion(curtain=curtain, version=last.version + 1 if last else 1,
+                                 content_hash=blob.content_hash)
+        last_snapshot = curtain.versions.filter(blob__isnull=False).order_by("-version").first()
+        # a delta only applies on top of the previous version, anything else starts from a snapshot
+        if (last is None or previous_blob is None or last.content_hash != previous_blob.content_hash
+                or last_snapshot is None
+                or version.version - last_snapshot.version >= CURTAIN_VERSION_SNAPSHOT_INTERVAL):
+            version.blob = blob
+        else:
+            if delta is None:
+                try:
+                    delta = jsonpatch.make_patch(load_curtain_blob(previous_blob), load_curtain_blob(blob)).patch
+                except orjson.JSONDecodeError:
+                    version.blob = blob
+            if version.blob is None:
+                version.delta = gzip.compress(orjson.dumps(delta), compresslevel=CURTAIN_COMPRESS_LEVEL, mtime=0)
+                # large string values such as raw data change as a whole, a delta that saves nothing is not kept
+                if len(version.delta) >= blob.file.size:
+                    version.blob = blob
+                    version.delta = None
+        version.save()
+    return version
+
+
+def load_curtain_version(version):
+    """
+    Rebuild the session of a version from the closest snapshot before it and the deltas in between.
+    """
+    versions = version.curtain.versions
+    snapshot = versions.filter(version__lte=version.version, blob__isnull=False).order_by("-version").first()
+    session = load_curtain_blob(snapshot.blob)
+    for delta in versions.filter(version__gt=snapshot.version, version__lte=version.version).order_by(
+            "version").values_list("delta", flat=True):
+        session = jsonpatch.apply_patch(session, orjson.loads(gzip.decompress(delta)), in_place=True)
+    return session
+
+
+def restore_curtain_version(curtain, version):
+    """
+    Make an earlier version the current session again, the restore itself is recorded as a new version.
+    A version kept as a delta is rebuilt from parsed JSON and serialized again, so unless that version came from
+    a JSON Patch its restored session has the same content but not the same bytes or content_hash as listed.
+    """
+    with transaction.atomic():
+        curtain = Curtain.objects.select_for_update().get(pk=curtain.pk)
+        if version.blob_id:
+            blob = version.blob
+        else:
+            blob = get_or_create_curtain_blob(ContentFile(orjson.dumps(load_curtain_version(version))))
+        set_curtain_blob(curtain, blob)
+    return curtain
+
+
+def save_curtain_session(curtain, uploaded_file):
+    """
+    Store an uploaded session. Sessions are deduplicated by content and kept gzip compressed,
+    they are compressed once here instead of on every download.
+    """
+    with transaction.atomic():
+        set_curtain_blob(curtain, get_or_create_curtain_blob(uploaded_file))
+
+
+class UploadOffsetMismatch(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Chunk offset does not match the upload offset."
+    default_code = "offset_mismatch"
+
+    def __init__(self, offset):
+        super().__init__()
+        # the current offset is returned as a number so that clients can resume from it
+        self.detail = {"detail": self.default_detail, "offset": offset}
+
+
+class SessionPreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "The session was changed since it was last fetched."
+    default_code = "precondition_failed"
+
+
+def curtain_session_etag(curtain):
+    return f'"{curtain.blob.content_hash}"'
+
+
+def patch_curtain_session(curtain, patch, if_match=None, get_etags=None):
+    """
+    Apply a JSON Patch to a stored session. The curtain row is locked while patching and the result is stored as
+    a new blob, so the previous session stays intact until the curtain is switched over. if_match is a list of
+    ETags one of which the curtain has to match, the session ETag or any returned by get_etags for the locked curtain.
+    """
+    with transaction.atomic():
+        curtain = Curtain.objects.select_for_update().get(pk=curtain.pk)
+        etags = [curtain_session_etag(curtain)] if curtain.blob_id else []
+        if get_etags:
+            etags.extend(get_etags(curtain))
+        if if_match is not None and "*" not in if_match and not set(etags).intersection(if_match):
+            raise SessionPreconditionFailed()
+        blob = ensure_curtain_blob(curtain)
+        # values added by the patch end up inside the session, keep the patch itself untouched for the version
+        delta = copy.deepcopy(patch)
+        try:
+            session = jsonpatch.apply_patch(load_curtain_blob(blob), patch, in_place=True)
+        except (orjson.JSONDecodeError, jsonpatch.JsonPatchException, jsonpointer.JsonPointerException,
+                TypeError) as e:
+            raise ValidationError({"patch": str(e)})
+        set_curtain_blob(curtain, get_or_create_curtain_blob(ContentFile(orjson.dumps(session))), delta=delta)
+    return curtain
+
+
+def discard_curtain_upload(upload):
+    upload.file.delete(save=False)
+    upload.delete()
+
+
+def create_curtain_upload(user=None, curtain=None, size=None, content_hash=""):
+    for expired in CurtainUpload.objects.filter(updated__lt=timezone.now() - CURTAIN_UPLOAD_EXPIRY):
+        discard_curtain_upload(expired)
+    upload = CurtainUpload(user=user, curtain=curtain, size=size, content_hash=content_hash.lower())
+    upload.file.save(f"{upload.upload_id}.part", ContentFile(b""))
+    return upload
+
+
+def append_curtain_upload_chunk(upload, offset, stream):
+    """
+    Append a chunk read from the request stream to the partial file. Chunks must be sent in order,
+    a chunk at any other offset than the current one is rejected with 409 and the current offset.
+    The body is spooled first so that no row lock or transaction is held while a slow client is sending it.
+    """
+    upload.refresh_from_db()
+    if offset != upload.offset:
+        raise UploadOffsetMismatch(upload.offset)
+    with tempfile.SpooledTemporaryFile(max_size=CURTAIN_SPOOL_SIZE) as spool:
+        length = 0
+        for chunk in iter(lambda: stream.read(CURTAIN_CHUNK_SIZE), b"") if stream else []:
+            length += len(chunk)
+            if upload.size is not None and offset + length > upload.size:
+                raise ValidationError({"size": "Upload exceeds the declared size."})
+            spool.write(chunk)
+        spool.seek(0)
+        with transaction.atomic():
+            # claims the range, a concurrent chunk for the same offset waits here and then finds the offset moved
+            claimed = CurtainUpload.objects.filter(pk=upload.pk, offset=offset).update(
+                offset=offset + length, updated=timezone.now()
+            )
+            if not claimed:
+                upload.refresh_from_db()
+                raise UploadOffsetMismatch(upload.offset)
+            with open(upload.file.path, "r+b") as f:
+                f.seek(offset)
+                f.truncate()
+                for chunk in iter(lambda: spool.read(CURTAIN_CHUNK_SIZE), b""):
+                    f.write(chunk)
+    upload.offset = offset + length
+    return upload
+
+
+def finalize_curtain_upload(upload, content_hash=""):
+    """
+    Verify the sha256 of a completed upload against the one given at init or finalize and store it as a blob.
+    """
+    expected_hash = (content_hash or upload.content_hash).lower()
+    if not expected_hash:
+        raise ValidationError({"sha256": "The sha256 of the session is required to finalize an upload."})
+    with open(upload.file.path, "rb") as f:
+        actual_hash, size = hash_curtain_session(f)
+        if upload.size is not None and size != upload.size:
+            raise UploadOffsetMismatch(size)
+        if actual_hash != expected_hash:
+            raise ValidationError({"sha256": "Checksum does not match the uploaded content."})
+        blob = get_or_create_curtain_blob(f, actual_hash, size)
+    discard_curtain_upload(upload)
+    return blob
+
+
+def iter_decompressed_file(stored_file):
+    with stored_file.open("rb") as f, gzip.GzipFile(fileobj=f, mode="rb") as gz:
+        for chunk in iter(lambda: gz.read(CURTAIN_CHUNK_SIZE), b""):
+            yield chunk
+
+
+def compressed_json_response(request, stored_file, file_name, last_modified=None, etag=None):
+    if accepts_gzip_re.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+        response = send_file(request, stored_file.name, attachment_filename=file_name, mimetype="application/json",
+                             encoding="gzip", last_modified=last_modified, etag=etag)
+    else:
+        response = StreamingHttpResponse(iter_decompressed_file(stored_file), content_type="application/json")
+        response["Content-Disposition"] = f'inline; filename="{file_name}"'
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def curtain_session_response(request, curtain, last_modified=None, etag=None):
+    """
+    Serve a stored session. Compressed sessions are sent as they are with Content-Encoding gzip to clients accepting it
+    and decompressed on the fly for the others, sessions stored before compression are sent unchanged.
+    last_modified and etag are the validators of the curtain that ranges are resumed against.
+    """
+    _, file_name = os.path.split(curtain.file.name)
+    if not file_name.endswith(".gz"):
+        return send_file(request, curtain.file.name, attachment_filename=file_name, last_modified=last_modified,
+                         etag=etag)
+
+    file_name = f"{curtain.link_id}.json" if curtain.blob_id else file_name[:-len(".gz")]
+    return compressed_json_response(request, curtain.file, file_name, last_modified=last_modified, etag=etag)
@@ -0,0 +1,110 @@
+import re
+from mimetypes import guess_type
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date
+from django_sendfile import sendfile
+from django_sendfile.backends.simple import was_modified_since
+from django_sendfile.utils import _sanitize_path
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+range_re = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) of a single byte range, None when the header should be ignored and the whole file sent,
+    or False when the range cannot be satisfied.
+    """
+    match = range_re.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        # malformed headers and multiple ranges are ignored
+        return None
+    first, last = match.groups()
+    if first == "":
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    if last != "" and int(last) < start:
+        # a last position before the first is an invalid range, ignored like a malformed header
+        return None
+    end = size - 1 if last == "" else min(int(last), size - 1)
+    if start >= size:
+        return False
+    return start, end
+
+
+def iter_file_range(f, length):
+    with f:
+        while length > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def send_file(request, file_name, attachment_filename=None, mimetype=None, encoding=None, last_modified=None,
+              etag=None):
+    """
+    sendfile with byte range support. The nginx and xsendfile backends hand ranges to the web server,
+    the simple backend is replaced by a streamed response answering single ranges with 206.
+    last_modified (a timestamp) and etag are the validators the caller sends instead of the file's own,
+    If-Range is matched against them.
+    """
+    if settings.SENDFILE_BACKEND != "django_sendfile.backends.simple":
+        response = sendfile(request, file_name, attachment_filename=attachment_filename, mimetype=mimetype,
+                            encoding=encoding)
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    path = _sanitize_path(file_name)
+    if not path.exists():
+        raise Http404('"%s" does not exist' % path)
+    stat = path.stat()
+    if last_modified is None:
+        last_modified = stat.st_mtime
+    if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), last_modified, stat.st_size):
+        return HttpResponseNotModified()
+    last_modified = http_date(last_modified)
+
+    guessed_mimetype, guessed_encoding = guess_type(str(path))
+    if mimetype is None:
+        mimetype = guessed_mimetype or "application/octet-stream"
+    encoding = encoding or guessed_encoding
+
+    byte_range = None
+    if "HTTP_RANGE" in request.META:
+        # a range is only valid for the version of the file the client already has part of
+        if_range = request.META.get("HTTP_IF_RANGE")
+        # weak ETags cannot validate a range
+        if if_range is None or if_range == last_modified or (etag and not etag.startswith("W/") and if_range == etag):
+            byte_range = parse_range(request.META["HTTP_RANGE"], stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+    elif byte_range:
+        start, end = byte_range
+        f = path.open("rb")
+        f.seek(start)
+        response = StreamingHttpResponse(iter_file_range(f, end - start + 1), status=206, content_type=mimetype)
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Content-Length"] = end - start + 1
+    else:
+        response = FileResponse(path.open("rb"), content_type=mimetype)
+        response["Content-Length"] = stat.st_size
+
+    if byte_range is not False:
+        response["Content-Disposition"] = content_disposition_header(False, attachment_filename or path.name)
+        if encoding:
+            response["Content-Encoding"] = encoding
+    response["Accept-Ranges"] = "bytes"
+    response["Last-Modified"] = last_modified
+    if etag:
+        response["ETag"] = etag
+    return response
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from celsus.curtain_storage import ensure_curtain_blob, get_curtain_sections
+from celsus.models import Curtain
+
+
+class Command(BaseCommand):
+    help = "Move curtain sessions stored before blobs and sections existed into blobs and split them into sections."
+
+    def handle(self, *args, **options):
+        converted = 0
+        for curtain in Curtain.objects.filter(blob__isnull=True).iterator():
+            ensure_curtain_blob(curtain)
+            get_curtain_sections(curtain)
+            converted += 1
+        for curtain in Curtain.objects.filter(blob__sectioned=False).select_related("blob").iterator():
+            get_curtain_sections(curtain)
+            converted += 1
+        self.stdout.write(f"Converted {converted} curtain sessions")
@@ -0,0 +1,13 @@
+from django.middleware.gzip import GZipMiddleware
+
+
+class RangeAwareGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that leaves byte range capable downloads alone, their ranges refer to the stored bytes
+    and would no longer line up once the response is recompressed.
+    """
+
+    def process_response(self, request, response):
+        if response.status_code == 206 or response.get("Accept-Ranges") == "bytes":
+            return response
+        return super().process_response(request, response)
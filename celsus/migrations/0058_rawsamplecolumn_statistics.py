@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0057_datafilterlist_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawsamplecolumn',
+            name='statistics',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
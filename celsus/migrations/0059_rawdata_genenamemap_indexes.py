@@ -0,0 +1,25 @@
+# Generated by Django 4.2.2 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0058_rawsamplecolumn_statistics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='genenamemap',
+            index=models.Index(fields=['gene_names'], name='genenamemap_gene_names_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rawdata',
+            index=models.Index(fields=['file', 'primary_id'], name='rawdata_file_primary_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rawdata',
+            index=models.Index(fields=['file', 'gene_names'], name='rawdata_file_gene_names_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.2 on 2026-10-18 23:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import re
+
+
+def populate_gene_profile(apps, schema_editor):
+    GeneProfile = apps.get_model("celsus", "GeneProfile")
+    DifferentialAnalysisData = apps.get_model("celsus", "DifferentialAnalysisData")
+    profiles = []
+    for primary_id, gene_names, fold_change, significant, comparison_id, project_id in DifferentialAnalysisData.objects.filter(
+            gene_names__isnull=False, comparison__file__project__isnull=False).values_list(
+            "primary_id", "gene_names__gene_names", "fold_change", "significant", "comparison_id",
+            "comparison__file__project_id").iterator():
+        for symbol in set(g for g in re.split(r"[\s;]+", gene_names.upper()) if g):
+            profiles.append(GeneProfile(
+                gene_symbol=symbol, primary_id=primary_id, fold_change=fold_change, significant=significant,
+                project_id=project_id, comparison_id=comparison_id
+            ))
+        if len(profiles) >= 5000:
+            GeneProfile.objects.bulk_create(profiles)
+            profiles = []
+    GeneProfile.objects.bulk_create(profiles)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0059_rawdata_genenamemap_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('gene_symbol', models.TextField()),
+                ('primary_id', models.TextField()),
+                ('fold_change', models.FloatField(null=True)),
+                ('significant', models.FloatField(null=True)),
+                ('comparison', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gene_profiles', to='celsus.comparison')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gene_profiles', to='celsus.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['gene_symbol', 'project'], name='geneprofile_symbol_project_idx')],
+            },
+        ),
+        migrations.RunPython(populate_gene_profile, migrations.RunPython.noop),
+    ]
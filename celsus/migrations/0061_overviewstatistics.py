@@ -0,0 +1,25 @@
+# Generated by Django 4.2.2 on 2026-10-18 23:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0060_geneprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverviewStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+                ('project_type', models.CharField(max_length=3, unique=True)),
+                ('project_count', models.IntegerField(default=0)),
+                ('unique_proteins', models.IntegerField(default=0)),
+                ('average_unique_proteins', models.FloatField(default=0)),
+            ],
+        ),
+    ]
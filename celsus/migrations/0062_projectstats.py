@@ -0,0 +1,50 @@
+# Generated by Django 4.2.2 on 2026-10-18 23:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import numpy as np
+from django.db.models import Count, Q
+
+
+def populate_project_stats(apps, schema_editor):
+    Project = apps.get_model("celsus", "Project")
+    ProjectStats = apps.get_model("celsus", "ProjectStats")
+    RawData = apps.get_model("celsus", "RawData")
+    Comparison = apps.get_model("celsus", "Comparison")
+    RawSampleColumn = apps.get_model("celsus", "RawSampleColumn")
+    DifferentialAnalysisData = apps.get_model("celsus", "DifferentialAnalysisData")
+    significant_cutoff = -np.log10(0.05)
+    for project in Project.objects.all().iterator():
+        ProjectStats.objects.create(
+            project=project,
+            protein_count=RawData.objects.filter(file__project=project).aggregate(
+                n=Count("gene_names__gene_names", distinct=True))["n"],
+            comparison_count=Comparison.objects.filter(file__project=project).count(),
+            sample_count=RawSampleColumn.objects.filter(file__project=project).count(),
+            significant_count=DifferentialAnalysisData.objects.filter(
+                Q(fold_change__lte=-0.6) | Q(fold_change__gte=0.6),
+                comparison__file__project=project, significant__gte=significant_cutoff).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0061_overviewstatistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStats',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='celsus.project')),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+                ('protein_count', models.IntegerField(default=0)),
+                ('comparison_count', models.IntegerField(default=0)),
+                ('sample_count', models.IntegerField(default=0)),
+                ('significant_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_project_stats, migrations.RunPython.noop),
+    ]
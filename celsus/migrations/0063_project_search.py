@@ -0,0 +1,53 @@
+# Generated by Django 4.2.2 on 2026-10-18 23:46
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models import Value
+
+
+def populate_search_index(apps, schema_editor):
+    Project = apps.get_model("celsus", "Project")
+    postgresql = schema_editor.connection.vendor == "postgresql"
+    for project in Project.objects.all().iterator():
+        parts = [project.description]
+        for field in ["keyword", "associated_authors", "organism"]:
+            parts.extend(getattr(project, field).values_list("name", flat=True))
+        search_text = "\n".join(p for p in parts if p)
+        values = {"search_text": search_text}
+        if postgresql:
+            values["search_vector"] = SearchVector("title", weight="A") + SearchVector(Value(search_text), weight="B")
+        Project.objects.filter(pk=project.pk).update(**values)
+
+
+def create_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS project_search_vector_idx ON celsus_project USING gin (search_vector)")
+
+
+def drop_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS project_search_vector_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0062_projectstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='search_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_vector_index, drop_search_vector_index),
+        migrations.RunPython(populate_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.2 on 2026-10-18 23:48
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_project_gene_index(apps, schema_editor):
+    Project = apps.get_model("celsus", "Project")
+    GeneNameMap = apps.get_model("celsus", "GeneNameMap")
+    ProjectGeneIndex = apps.get_model("celsus", "ProjectGeneIndex")
+    for project in Project.objects.all().iterator():
+        tokens = set()
+        for accession_id, gene_names in GeneNameMap.objects.filter(rawdata__file__project=project).values_list(
+                "accession_id", "gene_names").distinct().iterator():
+            for token_type, value in [("A", accession_id), ("G", gene_names)]:
+                if value:
+                    tokens.update((token_type, t) for t in re.split(r"[\s;]+", value.upper()) if t)
+        ProjectGeneIndex.objects.bulk_create(
+            [ProjectGeneIndex(token=token, token_type=token_type, project=project) for token_type, token in tokens],
+            batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0063_project_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectGeneIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.TextField()),
+                ('token_type', models.CharField(choices=[('G', 'Gene name'), ('A', 'Accession')], max_length=1)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gene_index', to='celsus.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token_type', 'token'], name='projectgeneindex_token_idx')],
+            },
+        ),
+        migrations.RunPython(populate_project_gene_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.2 on 2026-10-19 00:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0065_updated_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurtainBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(upload_to='media/files/curtain_blob/')),
+                ('size', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='curtain',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='curtains', to='celsus.curtainblob'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.2 on 2026-10-19 00:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('celsus', '0066_curtainblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurtainUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('upload_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('file', models.FileField(upload_to='media/files/curtain_chunk/')),
+                ('offset', models.BigIntegerField(default=0)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('content_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('curtain', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='celsus.curtain')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='curtain_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
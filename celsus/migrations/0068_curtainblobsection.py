@@ -0,0 +1,37 @@
+# Generated by Django 4.2.2 on 2026-10-19 00:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0067_curtainupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='curtainblob',
+            name='sectioned',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='CurtainBlobSection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField()),
+                ('position', models.IntegerField(default=0)),
+                ('file', models.FileField(upload_to='media/files/curtain_section/')),
+                ('size', models.BigIntegerField(default=0)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='celsus.curtainblob')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='curtainblobsection',
+            constraint=models.UniqueConstraint(fields=('blob', 'name'), name='curtainblobsection_blob_name_unique'),
+        ),
+    ]
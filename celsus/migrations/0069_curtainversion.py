@@ -0,0 +1,45 @@
+# Generated by Django 4.2.2 on 2026-10-19 00:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def populate_curtain_versions(apps, schema_editor):
+    # the session each curtain holds now becomes its first version
+    Curtain = apps.get_model("celsus", "Curtain")
+    CurtainVersion = apps.get_model("celsus", "CurtainVersion")
+    for curtain in Curtain.objects.filter(blob__isnull=False).select_related("blob").iterator():
+        CurtainVersion.objects.create(
+            curtain=curtain, version=1, blob=curtain.blob, content_hash=curtain.blob.content_hash
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('celsus', '0068_curtainblobsection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurtainVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('version', models.IntegerField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('delta', models.BinaryField(blank=True, null=True)),
+                ('blob', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='versions', to='celsus.curtainblob')),
+                ('curtain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='celsus.curtain')),
+            ],
+            options={
+                'ordering': ['version'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='curtainversion',
+            constraint=models.UniqueConstraint(fields=('curtain', 'version'), name='curtainversion_curtain_version_unique'),
+        ),
+        migrations.RunPython(populate_curtain_versions, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 import uuid
 
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 
@@ -85,6 +86,8 @@ class RawSampleColumn(models.Model):
         blank=True,
         null=True
     )
+    # json encoded log2 distribution statistics computed when the column is ingested
+    statistics = models.TextField(blank=True, null=True)
 
 
 class DifferentialAnalysisData(models.Model):
@@ -130,6 +133,12 @@ class RawData(models.Model):
         null=True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["file", "primary_id"], name="rawdata_file_primary_id_idx"),
+            models.Index(fields=["file", "gene_names"], name="rawdata_file_gene_names_idx"),
+        ]
+
 
 class SampleAnnotation(models.Model):
     created = models.DateTimeField(default=timezone.now, editable=False)
@@ -158,6 +167,7 @@ class Keyword(models.Model):
 
 class UniprotRecord(models.Model):
     created = models.DateTimeField(default=timezone.now, editable=False)
+    updated = models.DateTimeField(auto_now=True)
     entry = models.TextField()
     record = models.TextField()
 
@@ -173,9 +183,15 @@ class GeneNameMap(models.Model):
         null=True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["gene_names"], name="genenamemap_gene_names_idx"),
+        ]
+
 
 class ProjectSettings(models.Model):
     created = models.DateTimeField(default=timezone.now, editable=False)
+    updated = models.DateTimeField(auto_now=True)
     data = models.TextField(default="{}")
     project = models.ForeignKey(
         "Project", on_delete=models.CASCADE, related_name="project",
@@ -189,10 +205,42 @@ class Organism(models.Model):
     name = models.TextField()
 
 
+class CurtainBlob(models.Model):
+    # gzip compressed session content stored once per sha256 of the uncompressed upload
+    created = models.DateTimeField(default=timezone.now, editable=False)
+    content_hash = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="media/files/curtain_blob/")
+    size = models.BigIntegerField(default=0)
+    # set once the top level keys of the session have been stored as sections
+    sectioned = models.BooleanField(default=False)
+
+
+class CurtainBlobSection(models.Model):
+    # one top level key of a session stored gzip compressed on its own, position keeps the order of the manifest
+    blob = models.ForeignKey(CurtainBlob, on_delete=models.CASCADE, related_name="sections")
+    name = models.TextField()
+    position = models.IntegerField(default=0)
+    file = models.FileField(upload_to="media/files/curtain_section/")
+    size = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ["position"]
+        constraints = [
+            models.UniqueConstraint(fields=["blob", "name"], name="curtainblobsection_blob_name_unique"),
+        ]
+
+
 class Curtain(models.Model):
     created = models.DateTimeField(default=timezone.now, editable=False)
+    updated = models.DateTimeField(auto_now=True)
     link_id = models.TextField(unique=True, default=uuid.uuid4, null=False)
+    # for curtains stored as a blob this points at the blob file, older sessions keep their own file
     file = models.FileField(upload_to="media/files/curtain_upload/")
+    blob = models.ForeignKey(
+        CurtainBlob, on_delete=models.PROTECT, related_name="curtains",
+        blank=True,
+        null=True
+    )
     description = models.TextField()
     owners = models.ManyToManyField(User, related_name="curtain")
     enable = models.BooleanField(default=True)
@@ -214,6 +262,49 @@ class Curtain(models.Model):
         null=True
     )
 
+class CurtainUpload(models.Model):
+    # session uploaded in chunks, turned into a blob of a new or existing curtain when finalized
+    created = models.DateTimeField(default=timezone.now, editable=False)
+    updated = models.DateTimeField(auto_now=True)
+    upload_id = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
+    file = models.FileField(upload_to="media/files/curtain_chunk/")
+    offset = models.BigIntegerField(default=0)
+    size = models.BigIntegerField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="curtain_uploads",
+        blank=True,
+        null=True
+    )
+    curtain = models.ForeignKey(
+        "Curtain", on_delete=models.CASCADE, related_name="uploads",
+        blank=True,
+        null=True
+    )
+
+
+class CurtainVersion(models.Model):
+    # every stored state of a session, periodic snapshots keep a blob and the versions in between only the
+    # gzip compressed JSON Patch from the version before. content_hash is the hash of the session as it was stored,
+    # a delta version restored later is serialized again and can end up with a different hash
+    created = models.DateTimeField(default=timezone.now, editable=False)
+    curtain = models.ForeignKey("Curtain", on_delete=models.CASCADE, related_name="versions")
+    version = models.IntegerField()
+    content_hash = models.CharField(max_length=64)
+    blob = models.ForeignKey(
+        CurtainBlob, on_delete=models.PROTECT, related_name="versions",
+        blank=True,
+        null=True
+    )
+    delta = models.BinaryField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["version"]
+        constraints = [
+            models.UniqueConstraint(fields=["curtain", "version"], name="curtainversion_curtain_version_unique"),
+        ]
+
+
 class CurtainAccessToken(models.Model):
     created = models.DateTimeField(default=timezone.now, editable=False)
     curtain = models.ForeignKey(
@@ -302,6 +393,8 @@ class DataFilterList(models.Model):
 
 class Project(models.Model):
     created = models.DateTimeField(default=timezone.now, editable=False)
+    # also touched by celsus.signals when related objects of the project change
+    updated = models.DateTimeField(auto_now=True)
     title = models.TextField()
     description = models.TextField()
     sample_processing_protocol = models.TextField()
@@ -340,6 +433,11 @@ class Project(models.Model):
         null=True
     )
 
+    # denormalized text of the project and its vocabulary names, maintained by celsus.signals
+    search_text = models.TextField(blank=True, default="")
+    # only populated on PostgreSQL, the GIN index over it is created by migration 0063
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
     def __repr__(self):
         return self.title
 
@@ -347,10 +445,61 @@ class Project(models.Model):
         return self.title
 
     def get_unique_proteins(self):
-        unique_set = set()
-        for i in GeneNameMap.objects.filter(rawdata__file__project=self).distinct():
-            unique_set.add(i.gene_names)
-        return unique_set
+        return set(GeneNameMap.objects.filter(rawdata__file__project=self).values_list("gene_names", flat=True).distinct())
+
+
+class ProjectStats(models.Model):
+    # dataset sizes of a project, updated by the ingest and delete paths
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    updated = models.DateTimeField(default=timezone.now)
+    protein_count = models.IntegerField(default=0)
+    comparison_count = models.IntegerField(default=0)
+    sample_count = models.IntegerField(default=0)
+    significant_count = models.IntegerField(default=0)
+
+class GeneProfile(models.Model):
+    # gene-centric copy of differential analysis results, one row per gene symbol and data point
+    created = models.DateTimeField(default=timezone.now, editable=False)
+    gene_symbol = models.TextField()
+    primary_id = models.TextField()
+    fold_change = models.FloatField(null=True)
+    significant = models.FloatField(null=True)
+    project = models.ForeignKey(
+        "Project", on_delete=models.CASCADE, related_name="gene_profiles"
+    )
+    comparison = models.ForeignKey(
+        "Comparison", on_delete=models.CASCADE, related_name="gene_profiles"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["gene_symbol", "project"], name="geneprofile_symbol_project_idx"),
+        ]
+
+class ProjectGeneIndex(models.Model):
+    # distinct gene symbols and accessions found in the raw data of each project
+    token_type_choices = [
+        ("G", "Gene name"),
+        ("A", "Accession"),
+    ]
+    token = models.TextField()
+    token_type = models.CharField(max_length=1, choices=token_type_choices)
+    project = models.ForeignKey(
+        "Project", on_delete=models.CASCADE, related_name="gene_index"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["token_type", "token"], name="projectgeneindex_token_idx"),
+        ]
+
+class OverviewStatistics(models.Model):
+    # database overview figures per project type, the "ALL" row covers every project
+    updated = models.DateTimeField(default=timezone.now)
+    project_type = models.CharField(max_length=3, unique=True)
+    project_count = models.IntegerField(default=0)
+    unique_proteins = models.IntegerField(default=0)
+    average_unique_proteins = models.FloatField(default=0)
 
 class KinaseLibraryModel(models.Model):
     entry = models.TextField()
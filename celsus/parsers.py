@@ -0,0 +1,15 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+
+class JSONPatchParser(JSONParser):
+    """
+    Parses RFC 6902 JSON Patch documents, which are JSON arrays of operations.
+    """
+    media_type = 'application/json-patch+json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        data = super().parse(stream, media_type=media_type, parser_context=parser_context)
+        if not isinstance(data, list):
+            raise ParseError('JSON Patch document must be an array of operations.')
+        return data
@@ -9,7 +9,7 @@ from rest_framework import serializers
 from celsus.models import CellType, TissueType, ExperimentType, Instrument, Organism, OrganismPart, \
     QuantificationMethod, Project, Author, File, Keyword, Disease, Curtain, DifferentialSampleColumn, RawSampleColumn, \
     DifferentialAnalysisData, RawData, Comparison, GeneNameMap, LabGroup, UniprotRecord, ProjectSettings, \
-    KinaseLibraryModel, DataFilterList
+    KinaseLibraryModel, DataFilterList, ProjectStats, CurtainVersion
 from celsusdjango import settings
 
 
@@ -233,6 +233,17 @@ class CurtainSerializer(serializers.ModelSerializer):
         fields = ["id", "created", "link_id", "file", "enable", "description", "curtain_type"]
         lookup_field = "link_id"
 
+
+class CurtainVersionSerializer(serializers.ModelSerializer):
+    snapshot = serializers.SerializerMethodField()
+
+    def get_snapshot(self, record):
+        return record.blob_id is not None
+
+    class Meta:
+        model = CurtainVersion
+        fields = ["version", "created", "content_hash", "snapshot"]
+
 class DataFilterListSerializer(FlexFieldsModelSerializer):
     class Meta:
         model = DataFilterList
@@ -266,7 +277,7 @@ class DifferentialAnalysisDataSerializer(FlexFieldsModelSerializer):
 class RawSampleColumnSerializer(serializers.ModelSerializer):
     class Meta:
         model = RawSampleColumn
-        fields = [f.name for f in model._meta.fields]
+        fields = [f.name for f in model._meta.fields if f.name != "statistics"]
 
 
 class RawDataSerializer(serializers.ModelSerializer):
@@ -296,6 +307,46 @@ class FileSerializer(FlexFieldsModelSerializer):
         )
 
 
+class ProjectStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProjectStats
+        fields = ["protein_count", "comparison_count", "sample_count", "significant_count", "updated"]
+
+
+class VocabularyEntrySerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+
+
+class ProjectListSerializer(serializers.ModelSerializer):
+    """
+    Compact project representation used when listing projects, the full tree is served by ProjectSerializer.
+    """
+    organism = VocabularyEntrySerializer(many=True, read_only=True)
+    cell_type = VocabularyEntrySerializer(many=True, read_only=True)
+    tissue_type = VocabularyEntrySerializer(many=True, read_only=True)
+    disease = VocabularyEntrySerializer(many=True, read_only=True)
+    keyword = VocabularyEntrySerializer(many=True, read_only=True)
+    stats = ProjectStatsSerializer(read_only=True)
+
+    class Meta:
+        model = Project
+        fields = [
+            "id",
+            "title",
+            "date",
+            "enable",
+            "project_type",
+            "ptm_data",
+            "organism",
+            "cell_type",
+            "tissue_type",
+            "disease",
+            "keyword",
+            "stats"
+        ]
+
+
 class ProjectSerializer(FlexFieldsModelSerializer):
     quantification_method = QuantificationMethodSerializer(many=True, read_only=True)
     cell_type = CellTypeSerializer(many=True, read_only=True)
@@ -313,6 +364,7 @@ class ProjectSerializer(FlexFieldsModelSerializer):
     lab_group = LabGroupSerializer(many=True, read_only=True)
     owners = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     default_settings = serializers.PrimaryKeyRelatedField(read_only=True)
+    stats = ProjectStatsSerializer(read_only=True)
 
     class Meta:
         model = Project
@@ -341,7 +393,8 @@ class ProjectSerializer(FlexFieldsModelSerializer):
             "lab_group",
             "project_type",
             "owners",
-            "default_settings"
+            "default_settings",
+            "stats"
         ]
         expandable_fields = dict(
             quantification_method=(QuantificationMethodSerializer, dict(many=True, read_only=True)),
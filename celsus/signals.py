@@ -0,0 +1,173 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from celsus.models import Project, Keyword, Author, Organism, File, Curtain, Comparison, ProjectSettings, \
+    CurtainBlob
+from celsus.curtain_storage import release_curtain_blob
+from celsus.utils import update_project_search_index, invalidate_project_facets, touch_projects, \
+    PROJECT_FACET_VOCABULARIES
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, **kwargs):
+    update_project_search_index(instance)
+    invalidate_project_facets()
+
+
+@receiver(post_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    invalidate_project_facets()
+
+
+def linked_project_ids(through, instance):
+    # ids of the projects linked to a related object through one of the Project M2M tables
+    field = next(f for f in through._meta.fields if f.is_relation and f.related_model is type(instance))
+    return list(through.objects.filter(**{field.name: instance}).values_list("project_id", flat=True))
+
+
+def project_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            touch_projects(instance.pk)
+    elif action == "pre_clear":
+        # the links are gone once the clear is done, remember which projects they pointed to
+        instance._cleared_project_ids = linked_project_ids(sender, instance)
+    elif action == "post_clear":
+        touch_projects(*getattr(instance, "_cleared_project_ids", []))
+    elif action in ("post_add", "post_remove"):
+        touch_projects(*pk_set)
+
+
+def get_related_object_project_ids(instance):
+    return [i for field in Project._meta.many_to_many if field.related_model is type(instance)
+            for i in linked_project_ids(field.remote_field.through, instance)]
+
+
+def related_object_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    touch_projects(*get_related_object_project_ids(instance))
+
+
+def related_object_pre_delete(sender, instance, **kwargs):
+    instance._linked_project_ids = get_related_object_project_ids(instance)
+
+
+def related_object_deleted(sender, instance, **kwargs):
+    touch_projects(*getattr(instance, "_linked_project_ids", []))
+
+
+for field in Project._meta.many_to_many:
+    m2m_changed.connect(project_relation_changed, sender=field.remote_field.through,
+                        dispatch_uid=f"project_relation_changed_{field.name}")
+    # owners are serialized as ids only, so changes to the users themselves do not matter
+    if field.name == "owners":
+        continue
+    post_save.connect(related_object_saved, sender=field.related_model,
+                      dispatch_uid=f"related_object_saved_{field.related_model.__name__}")
+    pre_delete.connect(related_object_pre_delete, sender=field.related_model,
+                       dispatch_uid=f"related_object_pre_delete_{field.related_model.__name__}")
+    post_delete.connect(related_object_deleted, sender=field.related_model,
+                        dispatch_uid=f"related_object_deleted_{field.related_model.__name__}")
+
+
+@receiver(post_save, sender=File)
+@receiver(post_delete, sender=File)
+@receiver(post_save, sender=Curtain)
+@receiver(post_delete, sender=Curtain)
+@receiver(post_save, sender=ProjectSettings)
+def project_child_changed(sender, instance, **kwargs):
+    touch_projects(instance.project_id)
+
+
+@receiver(pre_delete, sender=Curtain)
+def curtain_pre_delete(sender, instance, **kwargs):
+    # versions are deleted along with the curtain, remember their snapshots to release them afterwards
+    instance._version_blob_ids = list(
+        instance.versions.filter(blob__isnull=False).values_list("blob_id", flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=Curtain)
+def curtain_deleted(sender, instance, **kwargs):
+    blob_ids = set(getattr(instance, "_version_blob_ids", []))
+    if instance.blob_id:
+        blob_ids.add(instance.blob_id)
+    for blob in CurtainBlob.objects.filter(pk__in=blob_ids):
+        release_curtain_blob(blob)
+
+
+@receiver(post_save, sender=Comparison)
+def comparison_saved(sender, instance, **kwargs):
+    if instance.file_id:
+        touch_projects(File.objects.filter(pk=instance.file_id).values_list("project_id", flat=True).first())
+
+
+def project_facet_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_project_facets()
+
+
+def facet_vocabulary_changed(sender, **kwargs):
+    invalidate_project_facets()
+
+
+for field_name in PROJECT_FACET_VOCABULARIES:
+    field = Project._meta.get_field(field_name)
+    m2m_changed.connect(project_facet_changed, sender=field.remote_field.through,
+                        dispatch_uid=f"project_facet_changed_{field_name}")
+    post_save.connect(facet_vocabulary_changed, sender=field.related_model,
+                      dispatch_uid=f"facet_vocabulary_saved_{field_name}")
+    post_delete.connect(facet_vocabulary_changed, sender=field.related_model,
+                        dispatch_uid=f"facet_vocabulary_deleted_{field_name}")
+
+
+@receiver(m2m_changed, sender=Project.keyword.through)
+@receiver(m2m_changed, sender=Project.associated_authors.through)
+@receiver(m2m_changed, sender=Project.organism.through)
+def project_vocabulary_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # a reverse clear does not carry the project ids, remember them before the links are gone
+        instance._search_project_ids = linked_project_ids(sender, instance)
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        update_project_search_index(instance)
+        return
+    project_ids = getattr(instance, "_search_project_ids", []) if action == "post_clear" else pk_set
+    for project in Project.objects.filter(pk__in=project_ids or []):
+        update_project_search_index(project)
+
+
+# field on Project linking each searchable vocabulary
+VOCABULARY_PROJECT_FIELDS = {Keyword: "keyword", Author: "associated_authors", Organism: "organism"}
+
+
+@receiver(post_save, sender=Keyword)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Organism)
+def vocabulary_saved(sender, instance, created, **kwargs):
+    # a renamed vocabulary entry changes the search text of every project using it
+    if created:
+        return
+    for project in Project.objects.filter(**{VOCABULARY_PROJECT_FIELDS[sender]: instance}).distinct():
+        update_project_search_index(project)
+
+
+@receiver(pre_delete, sender=Keyword)
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Organism)
+def vocabulary_pre_delete(sender, instance, **kwargs):
+    # deleting the entry removes its links without an m2m signal
+    instance._search_project_ids = list(
+        Project.objects.filter(**{VOCABULARY_PROJECT_FIELDS[sender]: instance}).values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Keyword)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Organism)
+def vocabulary_deleted(sender, instance, **kwargs):
+    for project in Project.objects.filter(pk__in=getattr(instance, "_search_project_ids", [])):
+        update_project_search_index(project)
@@ -1,6 +1,31 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from io import StringIO
+from unittest import mock
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django_sendfile.utils import _get_sendfile
+import msgpack
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from celsus.curtain_storage import save_curtain_session, load_curtain_blob, ensure_curtain_blob
 from celsus.models import Author, CellType, TissueType, Organism, OrganismPart, Disease, Instrument, \
-    QuantificationMethod, Project, Keyword
+    QuantificationMethod, Project, Keyword, Curtain, CurtainBlob, ExtraProperties, File, RawSampleColumn, RawData, \
+    GeneNameMap, Comparison, DifferentialAnalysisData
+from celsus.renderers import ORJSONRenderer, MessagePackRenderer
+from celsus.utils import refresh_project_summaries, refresh_gene_profile, get_overview_statistics
 from celsus.factories import CellTypeFactory, AuthorFactory, TissueTypeFactory, OrganismFactory, OrganismPartFactory, \
     DiseaseFactory, InstrumentFactory, QuantificationMethodFactory, KeywordFactory
 
@@ -131,3 +156,594 @@ class ProjectMethodTestCase(TestCase):
         c = Project.objects.all()
         for i in c:
             print(i.title, i.authors.all())
+
+
+class DataRendererTestCase(TestCase):
+    def test_renderers(self):
+        data = {"count": 2, "results": [{"id": 1, "value": np.float64(1.5)}, {"id": 2, "value": float("nan")}]}
+        self.assertEqual(
+            ORJSONRenderer().render(data),
+            b'{"count":2,"results":[{"id":1,"value":1.5},{"id":2,"value":null}]}'
+        )
+        unpacked = msgpack.unpackb(MessagePackRenderer().render(data))
+        self.assertEqual(unpacked["results"][0]["value"], 1.5)
+        self.assertEqual(unpacked["count"], 2)
+
+
+class RawDataMatrixTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        project = Project(enable=True)
+        project.save()
+        self.file = File(file_type="R", project=project)
+        self.file.save()
+        gene = GeneNameMap(accession_id="P12345", gene_names="LRRK2", entry="P12345")
+        gene.save()
+        for name, values in [("Sample1", [1.0, 2.0]), ("Sample2", [3.0, None])]:
+            column = RawSampleColumn(name=name, file=self.file)
+            column.save()
+            RawData(primary_id="P12345", value=values[0], raw_sample_column=column, gene_names=gene, file=self.file).save()
+            if values[1] is not None:
+                RawData(primary_id="Q99999", value=values[1], raw_sample_column=column, file=self.file).save()
+
+    def test_raw_data_arrow(self):
+        response = self.client.get(f"/files/{self.file.id}/raw_data_arrow/")
+        self.assertEqual(response.status_code, 200)
+        table = pa.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.column_names, ["primary_id", "gene_names", "Sample1", "Sample2"])
+        self.assertEqual(table.column("primary_id").to_pylist(), ["P12345", "Q99999"])
+        self.assertEqual(table.column("gene_names").to_pylist(), ["LRRK2", None])
+        self.assertEqual(table.column("Sample1").to_pylist(), [1.0, 2.0])
+        self.assertTrue(np.isnan(table.column("Sample2").to_pylist()[1]))
+
+    def test_matrix(self):
+        response = self.client.get(f"/files/{self.file.id}/matrix/", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s["name"] for s in response.json()["samples"]], ["Sample1", "Sample2"])
+        self.assertEqual(response.json()["primary_ids"], ["P12345", "Q99999"])
+        self.assertEqual(response.json()["values"], [[1.0, 3.0], [2.0, None]])
+        response = self.client.get(f"/files/{self.file.id}/matrix/?gene_names=lrrk2", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["primary_ids"], ["P12345"])
+        self.assertEqual(response.json()["values"], [[1.0, 3.0]])
+        gene = GeneNameMap(accession_id="Q5S006", gene_names="Lrrk2;Park8", entry="Q5S006")
+        gene.save()
+        for column in RawSampleColumn.objects.filter(file=self.file):
+            RawData(primary_id="Q5S006", value=5.0, raw_sample_column=column, gene_names=gene, file=self.file).save()
+        cache.clear()
+        response = self.client.get(f"/files/{self.file.id}/matrix/?gene_names=Lrrk2", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["primary_ids"], ["P12345", "Q5S006"])
+        response = self.client.get(f"/files/{self.file.id}/matrix/?gene_names=park8", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["primary_ids"], ["Q5S006"])
+
+    def test_boxplot_parameters(self):
+        column = RawSampleColumn.objects.get(file=self.file, name="Sample1")
+        response = self.client.get(f"/raw_sample_column/{column.id}/get_boxplot_parameters/", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["med"], 0.5)
+        self.assertEqual(response.json()["count"], 2)
+        self.assertEqual(sum(response.json()["histogram"]["counts"]), 2)
+        column.refresh_from_db()
+        self.assertIsNotNone(column.statistics)
+
+    def test_file_boxplot_parameters(self):
+        response = self.client.get(f"/raw_sample_column/get_file_boxplot_parameters/?file_id={self.file.id}", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["name"] for r in response.json()], ["Sample1", "Sample2"])
+        self.assertEqual(response.json()[1]["med"], np.log2(3.0))
+        column_id = response.json()[1]["id"]
+        response = self.client.get(f"/raw_sample_column/get_file_boxplot_parameters/?ids={column_id}", HTTP_ACCEPT="application/json")
+        self.assertEqual([r["id"] for r in response.json()], [column_id])
+
+    def test_search_genes(self):
+        response = self.client.post("/raw_data/search_genes/", {
+            "query": ["lrrk2"], "query_type": "gene_names", "file_id": self.file.id
+        }, content_type="application/json", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        samples = {s["id"]: s["name"] for s in response.json()["samples"]}
+        values = {samples[int(k)]: v for k, v in response.json()["results"]["LRRK2"]["P12345"].items()}
+        self.assertEqual(values, {"Sample1": 1.0, "Sample2": 3.0})
+        gene = GeneNameMap(accession_id="Q5S006", gene_names="Lrrk2 Park8;Dardarin", entry="Q5S006")
+        gene.save()
+        for column in RawSampleColumn.objects.filter(file=self.file):
+            RawData(primary_id="Q5S006", value=5.0, raw_sample_column=column, gene_names=gene, file=self.file).save()
+        for symbol in ["PARK8", "dardarin", "Lrrk2"]:
+            response = self.client.post("/raw_data/search_genes/", {
+                "query": [symbol], "query_type": "gene_names", "file_id": self.file.id
+            }, content_type="application/json", HTTP_ACCEPT="application/json")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("Q5S006", response.json()["results"]["Lrrk2 Park8;Dardarin"])
+        self.assertEqual(set(response.json()["results"]), {"LRRK2", "Lrrk2 Park8;Dardarin"})
+        for body in [{"query": "lrrk2", "file_id": self.file.id}, {"query": [1], "file_id": self.file.id},
+                     {"query": ["lrrk2"], "file_id": "a"}, {"query": ["lrrk2"], "project_id": None}]:
+            response = self.client.post("/raw_data/search_genes/", body, content_type="application/json",
+                                        HTTP_ACCEPT="application/json")
+            self.assertEqual(response.status_code, 400)
+
+    def test_overview_statistics(self):
+        refresh_project_summaries(self.file.project)
+        overview = get_overview_statistics()
+        self.assertEqual(overview["project_count"]["total"], 1)
+        self.assertEqual(overview["unique_proteins"]["average_unique_proteins"]["total_proteomics"], 1)
+
+
+class GeneProfileTestCase(TestCase):
+    def setUp(self) -> None:
+        gene = GeneNameMap(accession_id="Q5S007", gene_names="LRRK2 PARK8", entry="Q5S007")
+        gene.save()
+        for title, enable in [("Public", True), ("Private", False)]:
+            project = Project(title=title, enable=enable)
+            project.save()
+            file = File(file_type="DA", project=project)
+            file.save()
+            comparison = Comparison(name=f"{title} comparison", file=file)
+            comparison.save()
+            DifferentialAnalysisData(primary_id="Q5S007", gene_names=gene, fold_change=1.5, significant=2,
+                                     comparison=comparison).save()
+            refresh_gene_profile(comparison)
+
+    def test_gene_profile(self):
+        response = self.client.get("/differential_data/gene_profile/?gene_names=park8", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(response.json()[0]["project"]["title"], "Public")
+        self.assertEqual(response.json()[0]["fold_change"], 1.5)
+
+    def test_overview(self):
+        cache.clear()
+        response = self.client.get("/overview/", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["project_count"]["total"], 2)
+        self.assertEqual(response.json()["project_count"]["total_proteomics"], 2)
+        self.assertEqual(response.json()["unique_proteins"]["unique_proteins"], 1)
+
+    def test_project_stats(self):
+        project = Project.objects.get(title="Public")
+        refresh_project_summaries(project)
+        response = self.client.get(f"/projects/{project.id}/", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["stats"]["comparison_count"], 1)
+        self.assertEqual(response.json()["stats"]["significant_count"], 1)
+
+
+class ProjectSearchTestCase(TestCase):
+    def setUp(self) -> None:
+        keyword = Keyword(name="Parkinson")
+        keyword.save()
+        for title, description in [("Mitochondria study", "Parkinson disease model"), ("Parkinson cohort", "Brain tissue"),
+                                   ("Unrelated", "Yeast")]:
+            project = Project(title=title, description=description, enable=True)
+            project.save()
+        Project.objects.get(title="Unrelated").keyword.add(keyword)
+
+    def test_search_text_maintained(self):
+        project = Project.objects.get(title="Unrelated")
+        self.assertIn("Parkinson", project.search_text)
+        Keyword.objects.filter(name="Parkinson").first().project.remove(project)
+        project.refresh_from_db()
+        self.assertNotIn("Parkinson", project.search_text)
+
+    def test_search_text_cleared_and_deleted(self):
+        project = Project.objects.get(title="Unrelated")
+        Keyword.objects.get(name="Parkinson").project.clear()
+        project.refresh_from_db()
+        self.assertNotIn("Parkinson", project.search_text)
+        organism = Organism.objects.create(name="Zebra")
+        project.organism.add(organism)
+        project.refresh_from_db()
+        self.assertIn("Zebra", project.search_text)
+        organism.delete()
+        project.refresh_from_db()
+        self.assertNotIn("Zebra", project.search_text)
+
+    def test_ranked_search(self):
+        response = self.client.get("/projects/?search_query=parkinson&search_in=title,description,keyword",
+                                   HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        titles = [p["title"] for p in response.json()["results"]]
+        self.assertEqual(titles[0], "Parkinson cohort")
+        self.assertEqual(set(titles), {"Parkinson cohort", "Mitochondria study", "Unrelated"})
+
+    def test_search_in_fields(self):
+        for search_in, title in [("title", "Parkinson cohort"), ("description", "Mitochondria study"),
+                                 ("keyword", "Unrelated")]:
+            response = self.client.get(f"/projects/?search_query=parkinson&search_in={search_in}",
+                                       HTTP_ACCEPT="application/json")
+            self.assertEqual([p["title"] for p in response.json()["results"]], [title])
+
+    def test_gene_search(self):
+        project = Project.objects.get(title="Unrelated")
+        file = File(file_type="R", project=project)
+        file.save()
+        column = RawSampleColumn(name="Sample1", file=file)
+        column.save()
+        gene = GeneNameMap(accession_id="Q5S007", gene_names="LRRK2 PARK8", entry="Q5S007")
+        gene.save()
+        RawData(primary_id="Q5S007", value=1, raw_sample_column=column, gene_names=gene, file=file).save()
+        refresh_project_summaries(project)
+        for search_in, search_query in [("gene_names", "park8"), ("accession_id", "Q5S007"), ("gene_names", "LRRK2;SNCA")]:
+            response = self.client.get(f"/projects/?search_query={search_query}&search_in={search_in}",
+                                       HTTP_ACCEPT="application/json")
+            self.assertEqual([p["title"] for p in response.json()["results"]], ["Unrelated"])
+
+
+class ProjectFacetsTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.organism = Organism(name="Homo sapiens")
+        self.organism.save()
+        for title, enable in [("Public", True), ("Private", False)]:
+            project = Project(title=title, enable=enable)
+            project.save()
+            project.organism.add(self.organism)
+
+    def test_facets(self):
+        response = self.client.get("/projects/facets/", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], 1)
+        self.assertEqual(response.json()["organism"], [{"id": self.organism.id, "name": "Homo sapiens", "project_count": 1}])
+        self.assertEqual(response.json()["cell_type"], [])
+        self.assertEqual(response.json()["project_type"], [{"project_type": "TP", "project_count": 1}])
+
+    def test_facets_invalidated(self):
+        self.client.get("/projects/facets/", HTTP_ACCEPT="application/json")
+        Project.objects.get(title="Private").organism.clear()
+        project = Project(title="Second", enable=True)
+        project.save()
+        project.organism.add(self.organism)
+        response = self.client.get("/projects/facets/", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["organism"][0]["project_count"], 2)
+        response = self.client.get("/projects/facets/?title=second", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["total"], 1)
+
+    def test_combined_facet_filter(self):
+        disease = Disease(name="Parkinson's disease")
+        disease.save()
+        second = Project(title="Second", enable=True)
+        second.save()
+        second.organism.add(self.organism)
+        second.disease.add(disease)
+        response = self.client.get(f"/projects/?organism={self.organism.id}&disease={disease.id}",
+                                   HTTP_ACCEPT="application/json")
+        self.assertEqual([p["title"] for p in response.json()["results"]], ["Second"])
+        response = self.client.get(f"/projects/facets/?organism={self.organism.id}&disease={disease.id}",
+                                   HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["total"], 1)
+        self.assertEqual(response.json()["disease"][0]["project_count"], 1)
+        response = self.client.get("/projects/?organism=human", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class ProjectRepresentationTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.project = Project(title="Public", enable=True)
+        self.project.save()
+        self.organism = Organism(name="Homo sapiens")
+        self.organism.save()
+        self.project.organism.add(self.organism)
+
+    def test_list_is_compact(self):
+        response = self.client.get("/projects/", HTTP_ACCEPT="application/json")
+        project = response.json()["results"][0]
+        self.assertNotIn("files", project)
+        self.assertEqual(project["organism"], [{"id": self.organism.id, "name": "Homo sapiens"}])
+        response = self.client.get("/projects/?expand=default_settings", HTTP_ACCEPT="application/json")
+        self.assertIn("files", response.json()["results"][0])
+
+    def test_detail_cache_invalidated(self):
+        response = self.client.get(f"/projects/{self.project.id}/", HTTP_ACCEPT="application/json")
+        self.assertEqual(len(response.json()["organism"]), 1)
+        self.organism.name = "Human"
+        self.organism.save()
+        response = self.client.get(f"/projects/{self.project.id}/", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["organism"][0]["name"], "Human")
+        self.organism.project.clear()
+        response = self.client.get(f"/projects/{self.project.id}/", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["organism"], [])
+
+    def test_conditional_get(self):
+        url = f"/projects/{self.project.id}/"
+        response = self.client.get(url, HTTP_ACCEPT="application/json")
+        etag = response["ETag"]
+        response = self.client.get(url, HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.project.organism.remove(self.organism)
+        response = self.client.get(url, HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["organism"], [])
+        response = self.client.get(url, HTTP_ACCEPT="application/json", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_create_with_sections(self):
+        user = User.objects.create_user("curator", password="curator", is_staff=True)
+        self.client.force_login(user)
+        response = self.client.post("/projects/", {
+            "title": "Created", "description": "", "sample_processing_protocol": "", "data_processing_protocol": "",
+            "database_version": "",
+            "organism": [{"id": self.organism.id}, {"name": "Mus musculus"}],
+            "keyword": [{"name": "LRRK2"}, {"name": "LRRK2"}],
+            "first_authors": [{"name": "A. Author", "email": "a@example.org"}]
+        }, content_type="application/json", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        project = Project.objects.get(title="Created")
+        self.assertEqual(set(project.organism.values_list("name", flat=True)), {"Homo sapiens", "Mus musculus"})
+        self.assertEqual(Keyword.objects.filter(name="LRRK2").count(), 1)
+        self.assertEqual(project.first_authors.get().email, "a@example.org")
+        response = self.client.patch(f"/projects/{project.id}/", {"organism": [{"id": 999999}]},
+                                     content_type="application/json", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(project.organism.count(), 2)
+        response = self.client.patch(f"/projects/{project.id}/", {"organism": [{"name": "Mus musculus"}]},
+                                     content_type="application/json", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(project.organism.values_list("name", flat=True)), ["Mus musculus"])
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            file = File(file_type="R", project=self.project)
+            file.file.save("raw.txt", ContentFile(b"Index\tSample1\nP12345\t1.5\n"))
+            column = RawSampleColumn(name="Sample1", file=file)
+            column.save()
+            RawData(primary_id="P12345", value=1.5, raw_sample_column=column, file=file).save()
+            response = self.client.get(f"/projects/{self.project.id}/export/")
+            self.assertEqual(response.status_code, 200)
+            archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(json.loads(archive.read("project.json"))["title"], "Public")
+        self.assertEqual(archive.read(f"files/{file.id}_raw.txt"), b"Index\tSample1\nP12345\t1.5\n")
+        self.assertEqual(archive.read(f"data/raw_data_{file.id}.tsv").decode().splitlines(),
+                         ["sample\tprimary_id\tgene_names\tvalue", "Sample1\tP12345\t\t1.5"])
+
+    def test_export_parquet(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            file = File(file_type="R", project=self.project)
+            file.file.save("raw.txt", ContentFile(b"Index\tSample1\nP12345\t1.5\n"))
+            column = RawSampleColumn(name="Sample1", file=file)
+            column.save()
+            RawData(primary_id="P12345", value=1.5, raw_sample_column=column, file=file).save()
+            response = self.client.get(f"/projects/{self.project.id}/export/?table_format=parquet")
+            self.assertEqual(response.status_code, 200)
+            archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+            self.assertEqual(self.client.get(f"/projects/{self.project.id}/export/?table_format=xlsx").status_code, 400)
+        table = pq.read_table(io.BytesIO(archive.read(f"data/raw_data_{file.id}.parquet")))
+        self.assertEqual(table.to_pylist(), [{"sample": "Sample1", "primary_id": "P12345", "gene_names": None,
+                                              "value": 1.5}])
+
+
+class CurtainStorageTestCase(TestCase):
+    def setUp(self) -> None:
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name, SENDFILE_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.session = b'{"raw": "' + b"P12345\\t1.0\\n" * 1000 + b'"}'
+        self.curtain = Curtain(description="session")
+        save_curtain_session(self.curtain, ContentFile(self.session))
+
+    def test_stored_compressed(self):
+        self.assertTrue(self.curtain.file.name.endswith(".json.gz"))
+        self.assertLess(self.curtain.file.size, len(self.session))
+
+    def test_deduplicated(self):
+        fork = Curtain(description="fork")
+        save_curtain_session(fork, ContentFile(self.session))
+        self.assertEqual(fork.blob_id, self.curtain.blob_id)
+        self.assertEqual(CurtainBlob.objects.count(), 1)
+        path = fork.blob.file.path
+        self.curtain.delete()
+        self.assertTrue(os.path.exists(path))
+        save_curtain_session(fork, ContentFile(b'{"raw": ""}'))
+        # the first session is still the snapshot of the fork's first version
+        self.assertEqual(CurtainBlob.objects.count(), 2)
+        self.assertTrue(os.path.exists(path))
+        fork.delete()
+        self.assertEqual(CurtainBlob.objects.count(), 0)
+        self.assertFalse(os.path.exists(path))
+
+    def test_download(self):
+        url = f"/curtain/{self.curtain.link_id}/download/token=/"
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), self.session)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(response.streaming_content), self.session)
+
+    def test_nginx_backend(self):
+        _get_sendfile.cache_clear()
+        self.addCleanup(_get_sendfile.cache_clear)
+        with override_settings(SENDFILE_BACKEND="django_sendfile.backends.nginx", SENDFILE_URL="/protected-media"):
+            response = self.client.get(f"/curtain/{self.curtain.link_id}/download/token=/",
+                                       HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        # stand-in for the internal nginx location, which aliases /protected-media/ to the media root
+        location = unquote(response["X-Accel-Redirect"])
+        self.assertTrue(location.startswith("/protected-media/"))
+        with open(os.path.join(settings.SENDFILE_ROOT, location[len("/protected-media/"):]), "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), self.session)
+
+    def test_range(self):
+        url = f"/curtain/{self.curtain.link_id}/download/token=/"
+        with self.curtain.file.open("rb") as f:
+            stored = f.read()
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(stored)}")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(b"".join(response.streaming_content), stored[10:20])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), stored[-5:])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE=f"bytes={len(stored)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(stored)}")
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=5-3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), stored)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=10-19",
+                                   HTTP_IF_RANGE="Thu, 01 Jan 1970 00:00:00 GMT")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), stored)
+
+    def test_range_resume(self):
+        url = f"/curtain/{self.curtain.link_id}/download/token=/"
+        with self.curtain.file.open("rb") as f:
+            stored = f.read()
+        # a second curtain pointing at the same blob has validators unrelated to the file's mtime
+        self.curtain.description = "renamed"
+        self.curtain.save()
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        for validator in (response["Last-Modified"], response["ETag"]):
+            resumed = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=10-",
+                                      HTTP_IF_RANGE=validator)
+            self.assertEqual(resumed.status_code, 206)
+            self.assertEqual(b"".join(resumed.streaming_content), stored[10:])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=10-",
+                                   HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_range_not_recompressed(self):
+        file = File(file_type="O", project=Project.objects.create(title="Public", enable=True))
+        file.file.save("data.txt", ContentFile(b"0123456789" * 100))
+        response = self.client.get(f"/files/{file.id}/download/", HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response.status_code, 206)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+
+    def test_chunked_upload(self):
+        user = User.objects.create_user(username="uploader", password="uploader")
+        ExtraProperties.objects.create(user=user)
+        self.client.force_login(user)
+        content_hash = hashlib.sha256(self.session).hexdigest()
+        response = self.client.post("/curtain/upload/", {"size": len(self.session)}, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        upload_url = f"/curtain/upload/{response.json()['upload_id']}/"
+        half = len(self.session) // 2
+        response = self.client.put(f"{upload_url}?offset=0", self.session[:half],
+                                   content_type="application/octet-stream")
+        self.assertEqual(response.json()["offset"], half)
+        response = self.client.put(f"{upload_url}?offset=0", self.session[half:],
+                                   content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], half)
+        self.assertEqual(self.client.get(upload_url).json()["offset"], half)
+        self.client.put(f"{upload_url}?offset={half}", self.session[half:], content_type="application/octet-stream")
+        response = self.client.put(f"{upload_url}?offset={len(self.session)}", b"x",
+                                   content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(upload_url).json()["offset"], len(self.session))
+        response = self.client.post(f"{upload_url}finalize/", {"sha256": "0" * 64}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f"{upload_url}finalize/", {"sha256": content_hash, "description": "chunked"},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        curtain = Curtain.objects.get(link_id=response.json()["link_id"])
+        self.assertEqual(curtain.blob_id, self.curtain.blob_id)
+        self.assertEqual(curtain.description, "chunked")
+        self.assertIn(user, curtain.owners.all())
+        with curtain.blob.file.open("rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), self.session)
+        self.assertEqual(self.client.get(upload_url).status_code, 404)
+
+    def test_sections(self):
+        session = {"settings": {"title": "a"}, "processed": "P1\t2.0", "raw": "P1\t1.0"}
+        curtain = Curtain(description="sections", enable=True)
+        save_curtain_session(curtain, ContentFile(json.dumps(session).encode()))
+        response = self.client.get(f"/curtain/{curtain.link_id}/sections/token=/")
+        self.assertEqual([s["name"] for s in response.json()["sections"]], list(session))
+        self.assertEqual(response.json()["content_hash"], curtain.blob.content_hash)
+        url = f"/curtain/{curtain.link_id}/sections/settings/token=/"
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(b"".join(response.streaming_content))), session["settings"])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(f"/curtain/{curtain.link_id}/sections/raw/token=/")
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), session["raw"])
+        self.assertEqual(self.client.get(f"/curtain/{curtain.link_id}/sections/missing/token=/").status_code, 404)
+
+    def test_sections_legacy(self):
+        curtain = Curtain(description="legacy", enable=True)
+        curtain.file.save("legacy.json", ContentFile(self.session))
+        legacy_path = curtain.file.path
+        # a request that loaded the curtain before another one converted it
+        stale = Curtain.objects.get(pk=curtain.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(f"/curtain/{curtain.link_id}/sections/raw/token=/")
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), json.loads(self.session)["raw"])
+        self.assertFalse(os.path.exists(legacy_path))
+        curtain.refresh_from_db()
+        self.assertEqual(curtain.blob_id, self.curtain.blob_id)
+        self.assertEqual(ensure_curtain_blob(stale).pk, self.curtain.blob_id)
+
+    def test_convert_curtain_sessions(self):
+        curtain = Curtain(description="legacy")
+        curtain.file.save("legacy.json", ContentFile(self.session))
+        call_command("convert_curtain_sessions", stdout=StringIO())
+        curtain.refresh_from_db()
+        self.assertEqual(curtain.blob_id, self.curtain.blob_id)
+        self.assertTrue(curtain.blob.sectioned)
+
+    def test_json_patch(self):
+        user = User.objects.create_user(username="patcher", password="patcher")
+        ExtraProperties.objects.create(user=user, curtain_post=True)
+        self.client.force_login(user)
+        curtain = Curtain(description="patch")
+        save_curtain_session(curtain, ContentFile(json.dumps({"settings": {"colour": "red"}, "raw": "P1"}).encode()))
+        curtain.owners.add(user)
+        etag = self.client.get(f"/curtain/{curtain.link_id}/download/token=/")["ETag"]
+        url = f"/curtain/{curtain.link_id}/"
+        patch = json.dumps([{"op": "replace", "path": "/settings/colour", "value": "blue"}])
+        response = self.client.patch(url, patch, content_type="application/json-patch+json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        curtain.refresh_from_db()
+        self.assertEqual(load_curtain_blob(curtain.blob), {"settings": {"colour": "blue"}, "raw": "P1"})
+        response = self.client.patch(url, patch, content_type="application/json-patch+json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        response = self.client.patch(url, json.dumps([{"op": "remove", "path": "/missing"}]),
+                                     content_type="application/json-patch+json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(url, {"description": "renamed"}, content_type="application/json")
+        self.assertEqual(response.json()["description"], "renamed")
+        etag = self.client.get(url)["ETag"]
+        patch = json.dumps([{"op": "add", "path": "/settings/title", "value": "t"}])
+        response = self.client.patch(url, patch, content_type="application/json-patch+json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_versions(self):
+        user = User.objects.create_user(username="versions", password="versions")
+        ExtraProperties.objects.create(user=user, curtain_post=True)
+        self.client.force_login(user)
+        raw = "\n".join(f"P{i}\t{i * 0.37:.4f}" for i in range(2000))
+        curtain = Curtain(description="versions")
+        save_curtain_session(curtain, ContentFile(json.dumps({"settings": {"colour": "c0"}, "raw": raw}).encode()))
+        curtain.owners.add(user)
+        with mock.patch("celsus.curtain_storage.CURTAIN_VERSION_SNAPSHOT_INTERVAL", 3):
+            for i in range(1, 4):
+                self.client.patch(f"/curtain/{curtain.link_id}/",
+                                  json.dumps([{"op": "replace", "path": "/settings/colour", "value": f"c{i}"}]),
+                                  content_type="application/json-patch+json")
+            save_curtain_session(Curtain.objects.get(pk=curtain.pk),
+                                 ContentFile(json.dumps({"settings": {"colour": "c4"}, "raw": raw}).encode()))
+            # a small change to a large string is a full replace, which is kept as a snapshot instead
+            save_curtain_session(Curtain.objects.get(pk=curtain.pk),
+                                 ContentFile(json.dumps({"settings": {"colour": "c4"}, "raw": raw + "abc"}).encode()))
+        versions = self.client.get(f"/curtain/{curtain.link_id}/versions/").json()["versions"]
+        self.assertEqual([v["version"] for v in versions], [1, 2, 3, 4, 5, 6])
+        self.assertEqual([v["snapshot"] for v in versions], [True, False, False, True, False, True])
+        # only the snapshots and the current session keep a blob
+        self.assertEqual(CurtainBlob.objects.filter(curtains__isnull=True, versions__isnull=True).count(), 0)
+        response = self.client.post(f"/curtain/{curtain.link_id}/versions/3/restore/")
+        self.assertEqual(response.status_code, 200)
+        curtain.refresh_from_db()
+        self.assertEqual(load_curtain_blob(curtain.blob), {"settings": {"colour": "c2"}, "raw": raw})
+        self.assertEqual(curtain.versions.count(), 7)
+        self.assertEqual(self.client.post(f"/curtain/{curtain.link_id}/versions/99/restore/").status_code, 404)
+        blob_ids = list(curtain.versions.filter(blob__isnull=False).values_list("blob_id", flat=True))
+        curtain.delete()
+        self.assertFalse(CurtainBlob.objects.filter(pk__in=blob_ids).exists())
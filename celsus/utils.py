@@ -1,15 +1,51 @@
+import csv
+import hashlib
 import io
+import itertools
 import json
+import os
+import re
+import zipfile
+from urllib.parse import urlencode
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorExact
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum, Case, When, Value, FloatField, F
+from django.utils import timezone
+from filters.validations import CSVofIntegers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework_simplejwt.tokens import AccessToken
 from uniprotparser.betaparser import UniprotParser
+from voluptuous import Invalid
 
 from celsus.models import Project, GeneNameMap, UniprotRecord, Comparison, DifferentialSampleColumn, \
-    DifferentialAnalysisData, RawSampleColumn, RawData
+    DifferentialAnalysisData, RawSampleColumn, RawData, GeneProfile, OverviewStatistics, ProjectStats, \
+    ProjectGeneIndex
+
+# cutoffs of a significant differential analysis hit, significant holds -log10 p-values
+SIGNIFICANT_CUTOFF = -np.log10(0.05)
+FOLD_CHANGE_CUTOFF = 0.6
+
+DISTRIBUTION_QUANTILE_LEVELS = [1, 5, 10, 25, 50, 75, 90, 95, 99]
+DISTRIBUTION_HISTOGRAM_BINS = 50
+
+# vocabularies whose names are included in the project search text
+PROJECT_SEARCH_VOCABULARIES = ["keyword", "associated_authors", "organism"]
+
+# vocabularies counted by the project browse facets
+PROJECT_FACET_VOCABULARIES = ["cell_type", "tissue_type", "disease", "instrument", "keyword", "organism",
+                              "organism_part", "quantification_method", "experiment_type", "lab_group"]
+PROJECT_FACETS_CACHE_TIMEOUT = 60 * 60
+PROJECT_SERIALIZED_CACHE_TIMEOUT = 60 * 60 * 24
+# query parameters that do not change which projects are counted by the facets
+PROJECT_FACETS_IGNORED_PARAMS = {"limit", "offset", "page", "ordering", "format", "expand", "fields", "omit"}
 
 
 def get_user_from_token(request):
@@ -32,7 +68,251 @@ def is_user_staff(request):
     return False
 
 
+def build_project_search_text(project):
+    parts = [project.description]
+    for field in PROJECT_SEARCH_VOCABULARIES:
+        parts.extend(getattr(project, field).values_list("name", flat=True))
+    return "\n".join(p for p in parts if p)
+
+
+def update_project_search_index(project):
+    # update() instead of save() so that maintaining the index does not fire the post_save signal again
+    search_text = build_project_search_text(project)
+    values = {"search_text": search_text}
+    if connection.vendor == "postgresql":
+        values["search_vector"] = SearchVector("title", weight="A") + SearchVector(Value(search_text), weight="B")
+    Project.objects.filter(pk=project.pk).update(**values)
+
+
+def get_project_search(search_query, fields):
+    # returns the filter and relevance expression of a project text search restricted to the given fields,
+    # on PostgreSQL the indexed search vector narrows the candidates before each field is matched on its own
+    # while other databases fall back to substring matches
+    postgresql = connection.vendor == "postgresql"
+    query = SearchQuery(search_query, search_type="websearch") if postgresql else None
+    matches = {}
+    for field in fields:
+        if field in ("title", "description"):
+            if postgresql:
+                matches[field] = Q(SearchVectorExact(SearchVector(field), query))
+            else:
+                matches[field] = Q(**{f"{field}__icontains": search_query})
+            continue
+        m2m = Project._meta.get_field(field)
+        name = f"{m2m.m2m_reverse_field_name()}__name"
+        through = m2m.remote_field.through.objects
+        if postgresql:
+            through = through.filter(SearchVectorExact(SearchVector(name), query))
+        else:
+            through = through.filter(**{f"{name}__icontains": search_query})
+        matches[field] = Q(pk__in=through.values("project_id"))
+    text_query = Q()
+    for match in matches.values():
+        text_query |= match
+    if postgresql:
+        return Q(search_vector=query) & text_query, SearchRank(F("search_vector"), query)
+    whens = [When(matches["title"], then=Value(2.0))] if "title" in matches else []
+    whens.extend(When(match, then=Value(1.0)) for field, match in matches.items() if field != "title")
+    return text_query, Case(*whens, default=Value(0.0), output_field=FloatField())
+
+
+def get_project_facets(projects):
+    # project counts of every vocabulary entry within the given project queryset,
+    # counted on the M2M through tables with one grouped query per vocabulary
+    project_ids = projects.order_by().values("pk")
+    facets = {
+        "total": projects.order_by().values("pk").distinct().count(),
+        "project_type": list(Project.objects.filter(pk__in=project_ids).values("project_type").annotate(
+            project_count=Count("pk")).order_by("-project_count", "project_type"))
+    }
+    for vocabulary in PROJECT_FACET_VOCABULARIES:
+        field = Project._meta.get_field(vocabulary)
+        target = field.m2m_reverse_field_name()
+        facets[vocabulary] = [
+            {"id": i, "name": name, "project_count": n}
+            for i, name, n in field.remote_field.through.objects.filter(project_id__in=project_ids).values(
+                f"{target}_id", f"{target}__name").annotate(n=Count("project_id")).order_by(
+                "-n", f"{target}__name").values_list(f"{target}_id", f"{target}__name", "n")
+        ]
+    return facets
+
+
+def filter_projects_by_facets(projects, query_params):
+    # vocabulary filters given as comma separated ids, entries of one vocabulary are combined with OR
+    # and vocabularies with AND, each one a subquery on the indexed through table so no rows are multiplied
+    for vocabulary in PROJECT_FACET_VOCABULARIES:
+        value = query_params.get(vocabulary)
+        if not value:
+            continue
+        try:
+            ids = CSVofIntegers()(value)
+        except Invalid as e:
+            raise ParseError(detail=f"{vocabulary}: {e}")
+        field = Project._meta.get_field(vocabulary)
+        projects = projects.filter(pk__in=field.remote_field.through.objects.filter(
+            **{f"{field.m2m_reverse_field_name()}_id__in": ids}).values("project_id"))
+    return projects
+
+
+def get_project_facets_cache_key(query_params, is_staff):
+    params = sorted((k, v) for k, v in query_params.items() if k not in PROJECT_FACETS_IGNORED_PARAMS)
+    digest = hashlib.sha1(f"{is_staff}?{urlencode(params)}".encode()).hexdigest()
+    return f"project_facets_{cache.get_or_set('project_facets_version', 0, None)}_{digest}"
+
+
+def invalidate_project_facets():
+    # cached facets are keyed by a version number, bumping it retires every cached filter combination at once
+    try:
+        cache.incr("project_facets_version")
+    except ValueError:
+        cache.set("project_facets_version", 1, None)
+
+
+def project_serialized_cache_key(project):
+    # keyed by the modification time so that touching a project retires its cached form
+    return f"project_serialized_{project.pk}_{project.updated.timestamp()}"
+
+
+def touch_projects(*project_ids):
+    # mark projects as modified when objects nested in their serialized form change
+    project_ids = [i for i in project_ids if i]
+    if project_ids:
+        Project.objects.filter(pk__in=project_ids).update(updated=timezone.now())
+
+
+def normalize_gene_symbols(gene_names):
+    return set(g for g in re.split(r"[\s;]+", gene_names.upper()) if g)
+
+
+def refresh_gene_profile(comparison):
+    # rebuild the gene profile rows of one comparison from its differential analysis data
+    project_id = comparison.file.project_id if comparison.file else None
+    with transaction.atomic():
+        GeneProfile.objects.filter(comparison=comparison).delete()
+        if project_id is None:
+            return
+        profiles = []
+        for primary_id, gene_names, fold_change, significant in DifferentialAnalysisData.objects.filter(
+                comparison=comparison, gene_names__isnull=False).values_list(
+                "primary_id", "gene_names__gene_names", "fold_change", "significant").iterator():
+            for symbol in normalize_gene_symbols(gene_names):
+                profiles.append(GeneProfile(
+                    gene_symbol=symbol, primary_id=primary_id, fold_change=fold_change, significant=significant,
+                    project_id=project_id, comparison=comparison
+                ))
+        GeneProfile.objects.bulk_create(profiles, batch_size=5000)
+
+
+def refresh_file_gene_profile(file):
+    for c in file.comparisons.all():
+        refresh_gene_profile(c)
+
+
+def refresh_project_gene_index(project):
+    # rebuild the gene name and accession tokens of one project from its raw data
+    tokens = set()
+    for accession_id, gene_names in GeneNameMap.objects.filter(rawdata__file__project=project).values_list(
+            "accession_id", "gene_names").distinct().iterator():
+        if accession_id:
+            tokens.update(("A", t) for t in normalize_gene_symbols(accession_id))
+        if gene_names:
+            tokens.update(("G", t) for t in normalize_gene_symbols(gene_names))
+    with transaction.atomic():
+        ProjectGeneIndex.objects.filter(project=project).delete()
+        ProjectGeneIndex.objects.bulk_create(
+            [ProjectGeneIndex(token=token, token_type=token_type, project=project) for token_type, token in tokens],
+            batch_size=5000)
+
+
+def get_gene_index_projects(search_query, token_type):
+    # ids of projects whose raw data contains any of the gene names or accessions in the query
+    return ProjectGeneIndex.objects.filter(
+        token_type=token_type, token__in=normalize_gene_symbols(search_query)).values("project_id")
+
+
+def update_project_stats(project):
+    with transaction.atomic():
+        stats, _ = ProjectStats.objects.select_for_update().get_or_create(project=project)
+        stats.protein_count = RawData.objects.filter(file__project=project).aggregate(
+            n=Count("gene_names__gene_names", distinct=True))["n"]
+        stats.comparison_count = Comparison.objects.filter(file__project=project).count()
+        stats.sample_count = RawSampleColumn.objects.filter(file__project=project).count()
+        stats.significant_count = DifferentialAnalysisData.objects.filter(
+            Q(fold_change__lte=-FOLD_CHANGE_CUTOFF) | Q(fold_change__gte=FOLD_CHANGE_CUTOFF),
+            comparison__file__project=project, significant__gte=SIGNIFICANT_CUTOFF).count()
+        stats.updated = timezone.now()
+        stats.save()
+
+
+def refresh_project_summaries(*projects):
+    # called whenever data of the given projects is ingested, deleted or moved between projects
+    for project in projects:
+        if project:
+            update_project_stats(project)
+            refresh_project_gene_index(project)
+    touch_projects(*(project.pk for project in projects if project))
+    refresh_overview_statistics()
+
+
+def refresh_overview_statistics():
+    # recompute the overview summary table with grouped aggregates and drop the cached overview
+    project_types = dict(Project.objects.values("project_type").annotate(n=Count("id")).values_list("project_type", "n"))
+    unique_proteins = dict(RawData.objects.filter(file__project__isnull=False).values(
+        "file__project__project_type").annotate(n=Count("gene_names__gene_names", distinct=True)).values_list(
+        "file__project__project_type", "n"))
+    project_proteins = dict(ProjectStats.objects.values("project__project_type").annotate(
+        n=Sum("protein_count")).values_list("project__project_type", "n"))
+    rows = {"ALL": {
+        "project_count": sum(project_types.values()),
+        "unique_proteins": GeneNameMap.objects.aggregate(n=Count("gene_names", distinct=True))["n"],
+        "average_unique_proteins": 0
+    }}
+    if rows["ALL"]["project_count"] > 0:
+        rows["ALL"]["average_unique_proteins"] = sum(project_proteins.values()) / rows["ALL"]["project_count"]
+    for project_type, _ in Project.project_type_choices:
+        project_count = project_types.get(project_type, 0)
+        rows[project_type] = {
+            "project_count": project_count,
+            "unique_proteins": unique_proteins.get(project_type, 0),
+            "average_unique_proteins": project_proteins.get(project_type, 0) / project_count if project_count else 0
+        }
+    with transaction.atomic():
+        for project_type, values in rows.items():
+            OverviewStatistics.objects.update_or_create(
+                project_type=project_type, defaults=dict(values, updated=timezone.now()))
+    cache.delete("overview_statistics")
+
+
+def get_overview_statistics():
+    overview = cache.get("overview_statistics")
+    if overview is not None:
+        return overview
+    rows = {o.project_type: o for o in OverviewStatistics.objects.all()}
+    if "ALL" not in rows:
+        refresh_overview_statistics()
+        rows = {o.project_type: o for o in OverviewStatistics.objects.all()}
+    overview = {
+        "project_count": {
+            "total": rows["ALL"].project_count,
+            "total_proteomics": rows["TP"].project_count,
+            "ptm_proteomics": rows["PTM"].project_count
+        },
+        "unique_proteins": {
+            "unique_proteins": rows["ALL"].unique_proteins,
+            "average_unique_proteins": {
+                "total_proteomics": rows["TP"].average_unique_proteins,
+                "ptm_proteomics": rows["PTM"].average_unique_proteins
+            }
+        },
+        "updated": rows["ALL"].updated
+    }
+    cache.set("overview_statistics", overview, None)
+    return overview
+
+
 def delete_file_related_objects(file):
+    invalidate_file_data_cache(file.id)
+    GeneProfile.objects.filter(comparison__file=file).delete()
     for c in file.comparisons.all():
         with transaction.atomic():
             for column in c.differential_sample_columns.all():
@@ -45,6 +325,107 @@ def delete_file_related_objects(file):
     for rc in file.raw_sample_columns.all():
         with transaction.atomic():
             rc.delete()
+    refresh_project_summaries(file.project)
+
+
+# size of the pieces read from uploaded files and the number of rows written between flushes of an export
+EXPORT_CHUNK_SIZE = 1024 * 1024
+EXPORT_ROW_BATCH = 5000
+EXPORT_TABLE_FORMATS = ("tsv", "parquet")
+# columns of the data dumps, the tsv header uses the same names
+EXPORT_DIFFERENTIAL_ANALYSIS_SCHEMA = pa.schema([
+    ("comparison", pa.string()), ("primary_id", pa.string()), ("gene_names", pa.string()),
+    ("fold_change", pa.float64()), ("significant", pa.float64()), ("probability_score", pa.float64()),
+    ("sequence_window", pa.string()), ("peptide_sequence", pa.string()), ("ptm_position", pa.int64()),
+    ("ptm_position_in_peptide", pa.int64()),
+])
+EXPORT_RAW_DATA_SCHEMA = pa.schema([
+    ("sample", pa.string()), ("primary_id", pa.string()), ("gene_names", pa.string()), ("value", pa.float64()),
+])
+
+
+class ExportStreamBuffer(io.RawIOBase):
+    """
+    Write-only, unseekable sink for zipfile. Written bytes are held until taken by the streaming response,
+    zipfile falls back to data descriptors so entries never need to be rewritten.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_export_tsv(archive, buffer, name, schema, rows):
+    with archive.open(name, "w", force_zip64=True) as entry, \
+            io.TextIOWrapper(entry, encoding="utf-8", newline="") as text:
+        writer = csv.writer(text, delimiter="\t")
+        writer.writerow(schema.names)
+        for n, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if n % EXPORT_ROW_BATCH == 0:
+                text.flush()
+                yield buffer.take()
+    yield buffer.take()
+
+
+def iter_export_parquet(archive, buffer, name, schema, rows):
+    # the parquet writer only appends, so it streams into the zip entry like the tsv writer does
+    with archive.open(name, "w", force_zip64=True) as entry, \
+            pq.ParquetWriter(pa.PythonFile(entry, mode="w"), schema) as writer:
+        for batch in iter(lambda: list(itertools.islice(rows, EXPORT_ROW_BATCH)), []):
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(column, type=t) for column, t in zip(zip(*batch), schema.types)], schema=schema))
+            yield buffer.take()
+    yield buffer.take()
+
+
+def iter_export_table(archive, buffer, name, schema, rows, table_format):
+    if table_format == "parquet":
+        return iter_export_parquet(archive, buffer, f"{name}.parquet", schema, rows)
+    return iter_export_tsv(archive, buffer, f"{name}.tsv", schema, rows)
+
+
+def iter_project_export(project, project_data, table_format="tsv"):
+    # zip bundle of the project json, the original uploads and tsv or parquet dumps of their data written as it is
+    # streamed, rows are read with iterator() so large tables use server side cursors on PostgreSQL
+    buffer = ExportStreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("project.json", json.dumps(project_data, cls=JSONEncoder, indent=2))
+        yield buffer.take()
+        for file in project.files.all().order_by("id"):
+            if file.file and file.file.storage.exists(file.file.name):
+                with file.file.open("rb") as f, archive.open(
+                        f"files/{file.id}_{os.path.basename(file.file.name)}", "w", force_zip64=True) as entry:
+                    for chunk in iter(lambda: f.read(EXPORT_CHUNK_SIZE), b""):
+                        entry.write(chunk)
+                        yield buffer.take()
+                yield buffer.take()
+            if file.file_type == "DA":
+                yield from iter_export_table(
+                    archive, buffer, f"data/differential_analysis_{file.id}", EXPORT_DIFFERENTIAL_ANALYSIS_SCHEMA,
+                    DifferentialAnalysisData.objects.filter(comparison__file=file).order_by("comparison_id", "id").values_list(
+                        "comparison__name", "primary_id", "gene_names__gene_names", "fold_change", "significant",
+                        "probability_score", "sequence_window", "peptide_sequence", "ptm_position",
+                        "ptm_position_in_peptide").iterator(chunk_size=EXPORT_ROW_BATCH), table_format)
+            elif file.file_type == "R":
+                yield from iter_export_table(
+                    archive, buffer, f"data/raw_data_{file.id}", EXPORT_RAW_DATA_SCHEMA,
+                    RawData.objects.filter(file=file).order_by("raw_sample_column_id", "id").values_list(
+                        "raw_sample_column__name", "primary_id", "gene_names__gene_names", "value").iterator(
+                        chunk_size=EXPORT_ROW_BATCH), table_format)
+    yield buffer.take()
 
 
 def calculate_boxplot_parameters(values):
@@ -63,6 +444,129 @@ def calculate_boxplot_parameters(values):
 
     return {"low": real_low_val, "q1": q1, "med": med, "q3": q3, "high": real_high_val}
 
+def get_raw_data_matrix(file_id):
+    # pivot the raw data of a file into a protein x sample matrix straight from value tuples
+    samples = list(RawSampleColumn.objects.filter(file_id=file_id).order_by("id").values("id", "name"))
+    rows = pd.DataFrame.from_records(
+        RawData.objects.filter(file_id=file_id, raw_sample_column__isnull=False).order_by("id").values_list(
+            "primary_id", "gene_names__gene_names", "raw_sample_column_id", "value"
+        ),
+        columns=["primary_id", "gene_names", "raw_sample_column_id", "value"]
+    )
+    row_index, primary_ids = pd.factorize(rows["primary_id"], sort=False)
+    column_index = pd.Index([s["id"] for s in samples]).get_indexer(rows["raw_sample_column_id"])
+    # column-major so that every sample column is a contiguous buffer
+    values = np.full((len(primary_ids), len(samples)), np.nan, order="F")
+    values[row_index, column_index] = rows["value"].astype(float).to_numpy()
+    gene_names = np.empty(len(primary_ids), dtype=object)
+    gene_names[row_index] = rows["gene_names"].to_numpy()
+    return {
+        "file_id": file_id,
+        "samples": samples,
+        "primary_ids": np.asarray(primary_ids, dtype=object),
+        "gene_names": gene_names,
+        "values": values
+    }
+
+
+def get_cached_raw_data_matrix(file_id):
+    # kept until the raw data of the file changes, see invalidate_file_data_cache
+    matrix = cache.get(f"raw_data_matrix_{file_id}")
+    if matrix is None:
+        matrix = get_raw_data_matrix(file_id)
+        cache.set(f"raw_data_matrix_{file_id}", matrix, None)
+    return matrix
+
+
+def invalidate_file_data_cache(file_id):
+    cache.delete_many([f"raw_data_matrix_{file_id}", f"raw_sample_column_statistics_{file_id}"])
+
+
+def filter_raw_data_matrix(matrix, gene_names):
+    wanted = normalize_gene_symbols(" ".join(gene_names))
+    selected = np.fromiter(
+        (g is not None and not wanted.isdisjoint(normalize_gene_symbols(g)) for g in matrix["gene_names"]),
+        dtype=bool, count=len(matrix["gene_names"])
+    )
+    return dict(
+        matrix,
+        primary_ids=matrix["primary_ids"][selected],
+        gene_names=matrix["gene_names"][selected],
+        values=matrix["values"][selected]
+    )
+
+
+def raw_data_matrix_to_arrow(matrix):
+    names = ["primary_id", "gene_names"]
+    arrays = [pa.array(matrix["primary_ids"], type=pa.string()), pa.array(matrix["gene_names"], type=pa.string())]
+    for i, sample in enumerate(matrix["samples"]):
+        names.append(sample["name"])
+        arrays.append(pa.array(matrix["values"][:, i], type=pa.float64()))
+    metadata = {
+        "file_id": str(matrix["file_id"]),
+        "index": "primary_id",
+        "raw_sample_column_ids": json.dumps([s["id"] for s in matrix["samples"]])
+    }
+    table = pa.Table.from_arrays(arrays, names=names, metadata=metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def calculate_distribution_statistics(values):
+    values = np.asarray(values, dtype=float)
+    values = np.log2(values[np.isfinite(values) & (values > 0)])
+    if values.size == 0:
+        return {"count": 0}
+    result = {k: float(v) for k, v in calculate_boxplot_parameters(values).items()}
+    result["count"] = int(values.size)
+    result["mean"] = float(np.mean(values))
+    result["quantiles"] = {
+        "levels": DISTRIBUTION_QUANTILE_LEVELS,
+        "values": np.percentile(values, DISTRIBUTION_QUANTILE_LEVELS).tolist()
+    }
+    counts, bin_edges = np.histogram(values, bins=DISTRIBUTION_HISTOGRAM_BINS)
+    result["histogram"] = {"counts": counts.tolist(), "bin_edges": bin_edges.tolist()}
+    return result
+
+
+def update_raw_sample_column_statistics(raw_sample_column, values=None):
+    if values is None:
+        values = list(RawData.objects.filter(
+            raw_sample_column=raw_sample_column, value__isnull=False).values_list("value", flat=True))
+    raw_sample_column.statistics = json.dumps(calculate_distribution_statistics(values))
+    raw_sample_column.save(update_fields=["statistics"])
+
+
+def get_file_distribution_statistics(file_id):
+    # statistics of every raw sample column of a file, kept until the raw data of the file changes
+    result = cache.get(f"raw_sample_column_statistics_{file_id}")
+    if result is not None:
+        return result
+    columns = list(RawSampleColumn.objects.filter(file_id=file_id).order_by("id"))
+    missing = {c.id: c for c in columns if c.statistics is None}
+    if missing:
+        # one grouped query for every column ingested before statistics were stored
+        rows = np.array(list(
+            RawData.objects.filter(raw_sample_column_id__in=list(missing), value__isnull=False).order_by(
+                "raw_sample_column_id").values_list("raw_sample_column_id", "value")
+        ), dtype=float).reshape(-1, 2)
+        group_ids, starts = np.unique(rows[:, 0], return_index=True)
+        groups = dict(zip(group_ids.astype(int).tolist(), np.split(rows[:, 1], starts[1:])))
+        for column_id, column in missing.items():
+            column.statistics = json.dumps(calculate_distribution_statistics(groups.get(column_id, [])))
+        RawSampleColumn.objects.bulk_update(list(missing.values()), ["statistics"])
+    result = []
+    for c in columns:
+        res = json.loads(c.statistics)
+        res["id"] = c.id
+        res["name"] = c.name
+        result.append(res)
+    cache.set(f"raw_sample_column_statistics_{file_id}", result, None)
+    return result
+
+
 def check_nan_return_none(value):
     if pd.notnull(value):
         return value
@@ -191,7 +695,9 @@ def process_differential_analysis_data(data, file, df):
 
                 da.save()
             # da_objects.append(da)
+            refresh_gene_profile(comp)
         # DifferentialAnalysisData.objects.bulk_create(da_objects)
+    refresh_project_summaries(file.project)
 
 def process_raw_data(parameters, file, df):
     df = df.where(pd.notnull(df), None)
@@ -278,6 +784,7 @@ def process_raw_data(parameters, file, df):
         rsc = RawSampleColumn(name=s, file=file)
         rsc.save()
         # raw_objects = []
+        values = []
         with transaction.atomic():
             for i, row in temp_df.iterrows():
                 value = np.nan
@@ -285,6 +792,7 @@ def process_raw_data(parameters, file, df):
                     value = float(row[s])
                 except:
                     continue
+                values.append(value)
                 if row[accession_id_column] in geneMap:
                     # if row[accession_id_column] == s:
                     #    print(s)
@@ -301,4 +809,7 @@ def process_raw_data(parameters, file, df):
                                        file=file)
                 raw_data.save()
             # raw_objects.append(raw_data)
-        # RawData.objects.bulk_create(raw_objects)
\ No newline at end of file
+        # RawData.objects.bulk_create(raw_objects)
+        update_raw_sample_column_statistics(rsc, values)
+    invalidate_file_data_cache(file.id)
+    refresh_project_summaries(file.project)
\ No newline at end of file
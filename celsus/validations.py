@@ -52,6 +52,13 @@ raw_data_query_schema = base_query_params_schema.extend(
     }
 )
 
+raw_sample_column_query_schema = base_query_params_schema.extend(
+    {
+        "file_id": IntegerLike(),
+        "ids": CSVofIntegers(),
+    }
+)
+
 project_query_schema = base_query_params_schema.extend(
     {
         "id": IntegerLike(),
@@ -59,7 +66,17 @@ project_query_schema = base_query_params_schema.extend(
         "title": six.text_type,
         "ids": CSVofIntegers(),
         "owner_ids": CSVofIntegers(),
-        "project_type": GenericSeparatedValidator(str, ",")
+        "project_type": GenericSeparatedValidator(str, ","),
+        "cell_type": CSVofIntegers(),
+        "tissue_type": CSVofIntegers(),
+        "disease": CSVofIntegers(),
+        "instrument": CSVofIntegers(),
+        "keyword": CSVofIntegers(),
+        "organism": CSVofIntegers(),
+        "organism_part": CSVofIntegers(),
+        "quantification_method": CSVofIntegers(),
+        "experiment_type": CSVofIntegers(),
+        "lab_group": CSVofIntegers()
     }
 )
 
@@ -1,21 +1,27 @@
+import hashlib
 import json
 import os
 import uuid
 from datetime import timedelta
 
+from django.core.cache import cache
 from django.core.files.base import File as djangoFile
 from django.contrib.auth.models import User, AnonymousUser
 from django.db.models import Q, Count
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date, parse_etags
 from django.views.decorators.cache import cache_page, never_cache
-from django_sendfile import sendfile
 from filters.mixins import FiltersMixin
 from rest_flex_fields import is_expanded
 from rest_flex_fields.views import FlexFieldsMixin
 from rest_framework import viewsets, filters, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, JSONParser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 import pandas as pd
 from rest_framework_simplejwt.tokens import AccessToken
 from uniprotparser.betaparser import UniprotParser
@@ -27,7 +33,13 @@ import io
 from celsus.models import CellType, TissueType, ExperimentType, Instrument, Organism, OrganismPart, \
     QuantificationMethod, Project, Author, File, Keyword, Disease, Curtain, DifferentialSampleColumn, RawSampleColumn, \
     DifferentialAnalysisData, RawData, Comparison, GeneNameMap, LabGroup, UniprotRecord, ProjectSettings, \
-    CurtainAccessToken, KinaseLibraryModel, DataFilterList
+    CurtainAccessToken, KinaseLibraryModel, DataFilterList, GeneProfile, CurtainUpload
+from celsus.curtain_storage import save_curtain_session, curtain_session_response, set_curtain_blob, \
+    create_curtain_upload, append_curtain_upload_chunk, finalize_curtain_upload, get_curtain_sections, \
+    compressed_json_response, patch_curtain_session, curtain_session_etag, restore_curtain_version
+from celsus.downloads import send_file
+from celsus.parsers import JSONPatchParser
+from celsus.renderers import ORJSONRenderer, MessagePackRenderer
 from celsus.permissions import IsOwnerOrReadOnly, IsFileOwnerOrPublic, IsCurtainOwnerOrPublic, HasCurtainToken, \
     IsCurtainOwner, IsNonUserPostAllow, IsDataFilterListOwner
 from celsus.serializers import CellTypeSerializer, TissueTypeSerializer, ExperimentTypeSerializer, InstrumentSerializer, \
@@ -35,22 +47,80 @@ from celsus.serializers import CellTypeSerializer, TissueTypeSerializer, Experim
     AuthorSerializer, FileSerializer, KeywordSerializer, DifferentialSampleColumnSerializer, RawSampleColumnSerializer, \
     DifferentialAnalysisDataSerializer, RawDataSerializer, DiseaseSerializer, CurtainSerializer, ComparisonSerializer, \
     GeneNameMapSerializer, LabGroupSerializer, UniprotRecordSerializer, ProjectSettingsSerializer, \
-    KinaseLibrarySerializer, DataFilterListSerializer
-from celsus.utils import is_user_staff, delete_file_related_objects, calculate_boxplot_parameters, \
-    check_nan_return_none, get_uniprot_data
+    KinaseLibrarySerializer, DataFilterListSerializer, ProjectListSerializer, CurtainVersionSerializer
+from celsus.utils import is_user_staff, delete_file_related_objects, \
+    check_nan_return_none, get_uniprot_data, get_cached_raw_data_matrix, raw_data_matrix_to_arrow, \
+    filter_raw_data_matrix, update_raw_sample_column_statistics, get_file_distribution_statistics, \
+    refresh_file_gene_profile, normalize_gene_symbols, refresh_overview_statistics, \
+    refresh_project_summaries, get_project_search, get_gene_index_projects, get_project_facets, \
+    get_project_facets_cache_key, PROJECT_FACETS_CACHE_TIMEOUT, filter_projects_by_facets, \
+    project_serialized_cache_key, PROJECT_SERIALIZED_CACHE_TIMEOUT, iter_project_export, \
+    EXPORT_TABLE_FORMATS
 from celsus.validations import organism_query_schema, differential_data_query_schema, raw_data_query_schema, \
     comparison_query_schema, project_query_schema, gene_name_map_query_schema, uniprot_record_query_schema, \
-    curtain_query_schema, kinase_library_query_schema, data_filter_list_query_schema
+    curtain_query_schema, kinase_library_query_schema, data_filter_list_query_schema, raw_sample_column_query_schema
 from celsusdjango import settings
 
-
-class ProjectSettingsViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
+RAW_DATA_SEARCH_GENES_LIMIT = 5000
+PROJECT_TEXT_SEARCH_FIELDS = {"title", "description", "keyword", "associated_authors", "organism"}
+# flex fields parameters asking for the full project tree instead of the compact list form
+PROJECT_FULL_FORM_PARAMS = ("expand", "fields", "omit")
+
+# related sections of a project that can be given by id or name when creating or updating it
+PROJECT_SECTIONS = {
+    "cell_type": CellType,
+    "quantification_method": QuantificationMethod,
+    "tissue_type": TissueType,
+    "disease": Disease,
+    "instrument": Instrument,
+    "keyword": Keyword,
+    "organism": Organism,
+    "organism_part": OrganismPart,
+    "curtain": Curtain,
+    "experiment_type": ExperimentType,
+    "associated_authors": Author,
+    "first_authors": Author,
+    "lab_group": LabGroup,
+}
+
+# renderers negotiated by the viewsets returning large numeric payloads
+data_renderer_classes = [ORJSONRenderer, MessagePackRenderer] + list(api_settings.DEFAULT_RENDERER_CLASSES)
+
+
+class ConditionalRetrieveMixin:
+    """
+    Detail responses carry a strong ETag and Last-Modified derived from the object's updated timestamp,
+    a matching If-None-Match or If-Modified-Since returns 304 before the object is serialized.
+    """
+
+    def get_etag(self, request, instance):
+        # the same object renders differently per media type and flex fields parameters
+        version = f"{instance.pk}:{instance.updated.isoformat()}:{request.get_full_path()}:{request.accepted_media_type}"
+        return '"%s"' % hashlib.sha1(version.encode()).hexdigest()
+
+    def get_retrieve_data(self, instance):
+        return self.get_serializer(instance).data
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self.get_etag(request, instance)
+        last_modified = int(instance.updated.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = Response(self.get_retrieve_data(instance))
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        return response
+
+
+class ProjectSettingsViewSet(ConditionalRetrieveMixin, FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
     queryset = ProjectSettings.objects.all()
     serializer_class = ProjectSettingsSerializer
 
-class UniprotRecordViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
+class UniprotRecordViewSet(ConditionalRetrieveMixin, FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
     queryset = UniprotRecord.objects.all()
     serializer_class = UniprotRecordSerializer
+    renderer_classes = data_renderer_classes
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ("id", "entry")
     ordering = ("id",)
@@ -186,11 +256,22 @@ class DiseaseViewSet(FiltersMixin, viewsets.ModelViewSet):
     filter_validation_schema = organism_query_schema
 
 
-class ProjectViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
-    queryset = Project.objects.all()
+class SearchRankOrderingFilter(filters.OrderingFilter):
+    """
+    Ranked search results are ordered by relevance unless an ordering is explicitly requested.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if "search_rank" in queryset.query.annotations and not request.query_params.get(self.ordering_param):
+            return queryset.order_by("-search_rank", "id")
+        return super().filter_queryset(request, queryset, view)
+
+
+class ProjectViewSet(ConditionalRetrieveMixin, FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
+    queryset = Project.objects.select_related("stats")
     serializer_class = ProjectSerializer
     permission_classes = [IsOwnerOrReadOnly | permissions.IsAdminUser,]
-    filter_backends = [filters.OrderingFilter]
+    filter_backends = [SearchRankOrderingFilter]
     ordering_fields = ("id", "date")
     ordering = ("id",)
     filter_mappings = {
@@ -202,11 +283,19 @@ class ProjectViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
     }
     filter_validation_schema = project_query_schema
 
+    def get_serializer_class(self):
+        if self.action == "list" and not any(p in self.request.query_params for p in PROJECT_FULL_FORM_PARAMS):
+            return ProjectListSerializer
+        return self.serializer_class
+
     def get_queryset(self):
 
         if is_expanded(self.request, 'default_settings'):
 
             self.queryset = self.queryset.select_related("default_settings")
+        if self.get_serializer_class() is ProjectListSerializer:
+            self.queryset = self.queryset.prefetch_related("organism", "cell_type", "tissue_type", "disease", "keyword")
+        self.queryset = filter_projects_by_facets(self.queryset, self.request.query_params)
         search_query = self.request.query_params.get("search_query", "")
         search_in = self.request.query_params.get("search_in", "")
         is_staff = is_user_staff(self.request)
@@ -214,74 +303,45 @@ class ProjectViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
         if search_in != "" and search_query != "":
             query = Q()
             extra_params = search_in.split(",")
+            queryset = self.queryset
+            # title, description and vocabulary names are served by the project search index
+            text_fields = [i for i in extra_params if i in PROJECT_TEXT_SEARCH_FIELDS]
+            if text_fields:
+                text_query, rank = get_project_search(search_query, text_fields)
+                query.add(text_query, Q.OR)
+                queryset = queryset.annotate(search_rank=rank)
             for i in extra_params:
-                if i == "title":
-                    query.add(Q(title__icontains=search_query), Q.OR)
-                elif i == "description":
-                    query.add(Q(description__icontains=search_query), Q.OR)
-                elif i == "keyword":
-                    query.add(Q(keyword__name__icontains=search_query), Q.OR)
-                elif i == "associated_authors":
-                    query.add(Q(associated_authors__name__icontains=search_query), Q.OR)
-                elif i == "organism":
-                    query.add(Q(organism__name__icontains=search_query), Q.OR)
-                elif i == "accession_id":
-                    query.add(Q(files__raw_datas__gene_names__accession_id__icontains=search_query), Q.OR)
+                if i == "accession_id":
+                    query.add(Q(pk__in=get_gene_index_projects(search_query, "A")), Q.OR)
                 elif i == "gene_names":
-                    query.add(Q(files__raw_datas__gene_names__gene_names__icontains=search_query), Q.OR)
+                    query.add(Q(pk__in=get_gene_index_projects(search_query, "G")), Q.OR)
                 elif i == "lab_group":
                     query.add(Q(labgroup__name__icontains=search_query), Q.OR)
 
             if is_staff:
-                return self.queryset.filter(query).distinct()
-            return self.queryset.filter(query).filter(enable=True).distinct()
+                return queryset.filter(query).distinct()
+            return queryset.filter(query).filter(enable=True).distinct()
         if is_staff:
             return self.queryset
-        return Project.objects.filter(enable=True).distinct()
+        return self.queryset.filter(enable=True).distinct()
 
     def create(self, request, *args, **kwargs):
-        project = Project()
-        for i in Project._meta.fields:
-            if i.name in self.request.data:
-                if getattr(project, i.name) != self.request.data[i.name]:
-                    setattr(project, i.name, self.request.data[i.name])
-        project.save()
-
-        for i in self.request.data:
-            if i == "cell_type":
-                update_section(project.cell_type, self.request.data[i], CellType)
-            elif i == "quantification_method":
-                update_section(project.quantification_method, self.request.data[i], QuantificationMethod)
-            elif i == "tissue_type":
-                update_section(project.tissue_type, self.request.data[i], TissueType)
-            elif i == "disease":
-                update_section(project.disease, self.request.data[i], Disease)
-            elif i == "instrument":
-                update_section(project.instrument, self.request.data[i], Instrument)
-            elif i == "keyword":
-                update_section(project.keyword, self.request.data[i], Keyword)
-            elif i == "organism":
-                update_section(project.organism, self.request.data[i], Organism)
-            elif i == "organism_part":
-                update_section(project.organism_part, self.request.data[i], OrganismPart)
-            elif i == "curtain":
-                update_section(project.curtain, self.request.data[i], Curtain)
-            elif i == "experiment_type":
-                update_section(project.experiment_type, self.request.data[i], ExperimentType)
-            elif i == "associated_authors":
-                update_section(project.associated_authors, self.request.data[i], Author)
-            elif i == "lab_group":
-                update_section(project.lab_group, self.request.data[i], LabGroup)
-        if "first_authors" in self.request.data:
-            if len(self.request.data["first_authors"]) > 0:
-                update_section(project.first_authors, self.request.data["first_authors"], Author)
-        if self.request.user:
-            project.owners.add(self.request.user)
-        if project.project_type == "PTM":
-            project.ptm_data = True
-        project.default_settings = ProjectSettings()
-        project.default_settings.save()
-        project.save()
+        with transaction.atomic():
+            project = Project()
+            for i in Project._meta.fields:
+                if i.name in self.request.data:
+                    if getattr(project, i.name) != self.request.data[i.name]:
+                        setattr(project, i.name, self.request.data[i.name])
+            project.save()
+            update_project_sections(project, self.request.data)
+            if self.request.user:
+                project.owners.add(self.request.user)
+            if project.project_type == "PTM":
+                project.ptm_data = True
+            project.default_settings = ProjectSettings()
+            project.default_settings.save()
+            project.save()
+            refresh_project_summaries(project)
         project_json = ProjectSerializer(project, context={'request': request})
         pro = project_json.data
         pro["id"] = project.id
@@ -290,50 +350,65 @@ class ProjectViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
 
     def update(self, request, *args, **kwargs):
         project = self.get_object()
-        for i in self.request.data:
-            if i == "cell_type":
-                update_section(project.cell_type, self.request.data[i], CellType)
-            elif i == "quantification_method":
-                update_section(project.quantification_method, self.request.data[i], QuantificationMethod)
-            elif i == "tissue_type":
-                update_section(project.tissue_type, self.request.data[i], TissueType)
-            elif i == "disease":
-                update_section(project.disease, self.request.data[i], Disease)
-            elif i == "instrument":
-                update_section(project.instrument, self.request.data[i], Instrument)
-            elif i == "keyword":
-                update_section(project.keyword, self.request.data[i], Keyword)
-            elif i == "organism":
-                update_section(project.organism, self.request.data[i], Organism)
-            elif i == "organism_part":
-                update_section(project.organism_part, self.request.data[i], OrganismPart)
-            elif i == "curtain":
-                update_section(project.curtain, self.request.data[i], Curtain)
-            elif i == "experiment_type":
-                update_section(project.experiment_type, self.request.data[i], ExperimentType)
-            elif i == "disease":
-                update_section(project.disease, self.request.data[i], Disease)
-            elif i == "associated_authors":
-                update_section(project.associated_authors, self.request.data[i], Author)
-            elif i == "lab_group":
-                update_section(project.lab_group, self.request.data[i], LabGroup)
-        d = {}
-        for i in Project._meta.fields:
-            if i.name in self.request.data:
-                if getattr(project, i.name) != self.request.data[i.name]:
-                    setattr(project, i.name, self.request.data[i.name])
-        if d:
-            project.update(**d)
-        project.save()
+        with transaction.atomic():
+            update_project_sections(project, self.request.data)
+            d = {}
+            for i in Project._meta.fields:
+                if i.name in self.request.data:
+                    if getattr(project, i.name) != self.request.data[i.name]:
+                        setattr(project, i.name, self.request.data[i.name])
+            if d:
+                project.update(**d)
+            project.save()
+        if "project_type" in self.request.data:
+            refresh_overview_statistics()
         project_json = ProjectSerializer(project, context={'request': request})
         return Response(project_json.data)
 
+    def get_retrieve_data(self, instance):
+        if any(p in self.request.query_params for p in PROJECT_FULL_FORM_PARAMS):
+            return super().get_retrieve_data(instance)
+        cache_key = project_serialized_cache_key(instance)
+        data = cache.get(cache_key)
+        if data is None:
+            data = super().get_retrieve_data(instance)
+            cache.set(cache_key, data, PROJECT_SERIALIZED_CACHE_TIMEOUT)
+        return data
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        refresh_overview_statistics()
+
+    @action(methods=["get"], detail=True)
+    def export(self, request, pk=None):
+        project = self.get_object()
+        table_format = request.query_params.get("table_format", "tsv")
+        if table_format not in EXPORT_TABLE_FORMATS:
+            return Response(data={"table_format": f"Must be one of {', '.join(EXPORT_TABLE_FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(iter_project_export(project, self.get_retrieve_data(project), table_format),
+                                         content_type="application/zip")
+        response["Content-Disposition"] = f'attachment; filename="project_{project.id}.zip"'
+        return response
+
+    @action(methods=["get"], detail=False)
+    def facets(self, request):
+        cache_key = get_project_facets_cache_key(request.query_params, is_user_staff(request))
+        facets = cache.get(cache_key)
+        if facets is None:
+            facets = get_project_facets(self.get_queryset())
+            cache.set(cache_key, facets, PROJECT_FACETS_CACHE_TIMEOUT)
+        return Response(facets)
+
     @action(methods=["post"], detail=True, permission_classes=[permissions.IsAuthenticated & (IsOwnerOrReadOnly | permissions.IsAdminUser)])
     def set_file(self, request, pk=None):
         project = self.get_object()
         file = File.objects.filter(pk=self.request.data["file_id"]).first()
+        previous_project = file.project
         project.files.add(file)
         project.save()
+        refresh_file_gene_profile(file)
+        refresh_project_summaries(previous_project, project)
         project_json = ProjectSerializer(project, context={'request': request})
         project_json.data["id"] = project.id
         return Response(project_json.data)
@@ -500,10 +575,13 @@ class FileViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         file = self.get_object()
         if file.project.id != self.request.data["project"]["id"]:
+            previous_project = file.project
             project = Project.objects.filter(pk=self.request.data["project"]["id"]).first()
             project.files.add(file)
             project.save()
             file.save()
+            refresh_file_gene_profile(file)
+            refresh_project_summaries(previous_project, project)
         file_json = FileSerializer(file, context={'request': request})
         return Response(file_json.data)
 
@@ -519,10 +597,13 @@ class FileViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
     def set_project(self, request, pk=None):
         file = self.get_object()
         if "project_id" in self.request.data:
+            previous_project = file.project
             project = Project.objects.filter(pk=self.request.data["project_id"]).first()
             project.files.add(file)
             project.save()
             file.save()
+            refresh_file_gene_profile(file)
+            refresh_project_summaries(previous_project, project)
         file_json = FileSerializer(file, context={'request': request})
         return Response(file_json.data)
 
@@ -536,7 +617,32 @@ class FileViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
     def download(self, request, pk=None):
         file = self.get_object()
         _, file_name = os.path.split(file.file.name)
-        return sendfile(request, file.file.name, attachment_filename=file_name)
+        return send_file(request, file.file.name, attachment_filename=file_name)
+
+    @action(methods=["get"], detail=True, permission_classes=[permissions.IsAdminUser | IsFileOwnerOrPublic,])
+    def raw_data_arrow(self, request, pk=None):
+        file = self.get_object()
+        matrix = get_cached_raw_data_matrix(file.id)
+        response = HttpResponse(raw_data_matrix_to_arrow(matrix), content_type="application/vnd.apache.arrow.stream")
+        response["Content-Disposition"] = f'attachment; filename="raw_data_{file.id}.arrow"'
+        return response
+
+    @action(methods=["get"], detail=True, permission_classes=[permissions.IsAdminUser | IsFileOwnerOrPublic,],
+            renderer_classes=data_renderer_classes)
+    def matrix(self, request, pk=None):
+        file = self.get_object()
+        matrix = get_cached_raw_data_matrix(file.id)
+        gene_names = self.request.query_params.get("gene_names", "")
+        if gene_names != "":
+            matrix = filter_raw_data_matrix(matrix, gene_names.split(","))
+        values = matrix["values"]
+        return Response({
+            "file_id": file.id,
+            "samples": matrix["samples"],
+            "primary_ids": matrix["primary_ids"].tolist(),
+            "gene_names": matrix["gene_names"].tolist(),
+            "values": np.where(np.isnan(values), None, values).tolist()
+        })
 
 
 class DifferentialSampleColumnViewSet(viewsets.ModelViewSet):
@@ -548,31 +654,51 @@ class LabGroupViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
     queryset = LabGroup.objects.all().prefetch_related("project").annotate(project_count=Count("project"))
     serializer_class = LabGroupSerializer
 
-class RawSampleColumnViewSet(viewsets.ModelViewSet):
+class RawSampleColumnViewSet(FiltersMixin, viewsets.ModelViewSet):
     queryset = RawSampleColumn.objects.all()
     serializer_class = RawSampleColumnSerializer
+    renderer_classes = data_renderer_classes
+    filter_mappings = {
+        "file_id": "file_id__exact",
+        "ids": "pk__in"
+    }
+    filter_validation_schema = raw_sample_column_query_schema
+
+    def get_queryset(self):
+        if is_user_staff(self.request):
+            return self.queryset
+        return self.queryset.filter(file__project__enable=True)
 
-    @method_decorator(cache_page(60 * 60 * 2))
     @action(methods=["get"], detail=True, permission_classes=[permissions.AllowAny])
     def get_boxplot_parameters(self, request, pk=None):
         raw_sample_column = self.get_object()
-        data = RawData.objects.filter(raw_sample_column_id__exact=raw_sample_column.id)
-        print(data.all())
-        values = []
-        for i in data.all():
-            if i.value:
-                values.append(np.log2(i.value))
-        values = np.array(values)
-        print(values)
-        res = calculate_boxplot_parameters(values)
+        if raw_sample_column.statistics is None:
+            # columns ingested before statistics were stored are computed once and kept
+            update_raw_sample_column_statistics(raw_sample_column)
+        res = json.loads(raw_sample_column.statistics)
         res["id"] = raw_sample_column.id
         res["name"] = raw_sample_column.name
         return Response(res)
 
+    @action(methods=["get"], detail=False, permission_classes=[permissions.AllowAny])
+    def get_file_boxplot_parameters(self, request):
+        # boxplot parameters of every column of a file, or of the columns listed in ids, in one request
+        if "file_id" not in self.request.query_params and "ids" not in self.request.query_params:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        columns = self.get_queryset()
+        ids = set(columns.values_list("id", flat=True))
+        results = []
+        for file_id in columns.values_list("file_id", flat=True).distinct().order_by("file_id"):
+            for res in get_file_distribution_statistics(file_id):
+                if res["id"] in ids:
+                    results.append(res)
+        return Response(results)
+
 
 class DifferentialAnalysisDataViewSet(FiltersMixin, FlexFieldsMixin, viewsets.ModelViewSet):
     queryset = DifferentialAnalysisData.objects.all()
     serializer_class = DifferentialAnalysisDataSerializer
+    renderer_classes = data_renderer_classes
     filter_backends = [filters.OrderingFilter]
     permit_list_expands = ["gene_names", "comparison", "comparison.file", "comparison.file.project"]
     ordering_fields = ("id", "primary_id", "gene_names", "comparison", "fold_change", "significant")
@@ -649,9 +775,34 @@ class DifferentialAnalysisDataViewSet(FiltersMixin, FlexFieldsMixin, viewsets.Mo
             })
         return Response({"count": 0, "results": []})
 
+    @action(methods=["get"], detail=False, permission_classes=[permissions.AllowAny])
+    def gene_profile(self, request, *args, **kwargs):
+        # differential analysis results of genes across every project from the gene profile table
+        symbols = set()
+        for g in self.request.query_params.get("gene_names", "").split(","):
+            symbols.update(normalize_gene_symbols(g))
+        if not symbols:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        profiles = GeneProfile.objects.filter(gene_symbol__in=symbols)
+        if not is_user_staff(self.request):
+            profiles = profiles.filter(project__enable=True)
+        results = profiles.order_by("gene_symbol", "project_id", "comparison_id").values(
+            "gene_symbol", "primary_id", "fold_change", "significant", "project_id", "project__title",
+            "comparison_id", "comparison__name"
+        )
+        return Response([{
+            "gene_symbol": r["gene_symbol"],
+            "primary_id": r["primary_id"],
+            "fold_change": r["fold_change"],
+            "significant": r["significant"],
+            "project": {"id": r["project_id"], "title": r["project__title"]},
+            "comparison": {"id": r["comparison_id"], "name": r["comparison__name"]}
+        } for r in results])
+
 class RawDataViewSet(FiltersMixin, viewsets.ModelViewSet):
     queryset = RawData.objects.all()
     serializer_class = RawDataSerializer
+    renderer_classes = data_renderer_classes
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ("id", "primary_id", "gene_names")
     ordering = ("gene_names",)
@@ -676,12 +827,58 @@ class RawDataViewSet(FiltersMixin, viewsets.ModelViewSet):
         project_limit = Project.objects.filter(enable=True)
         return RawData.objects.filter(file__project__in=project_limit).distinct()
 
+    @action(methods=["post"], detail=False, permission_classes=[permissions.AllowAny])
+    def search_genes(self, request, *args, **kwargs):
+        # raw intensities of a list of genes or primary ids within a file or a project in one query
+        query = self.request.data.get("query", [])
+        query_type = self.request.data.get("query_type", "gene_names")
+        if not isinstance(query, list) or not all(isinstance(q, str) for q in query):
+            return Response(data={"query": "Query must be a list of strings."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(query) == 0 or len(query) > RAW_DATA_SEARCH_GENES_LIMIT or query_type not in ("gene_names", "primary_id"):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        for id_field in ("file_id", "project_id"):
+            if id_field in self.request.data and not str(self.request.data[id_field]).isdigit():
+                return Response(data={id_field: "Must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if "file_id" in self.request.data:
+            results = RawData.objects.filter(file_id=int(self.request.data["file_id"]))
+        elif "project_id" in self.request.data:
+            results = RawData.objects.filter(file__project_id=int(self.request.data["project_id"]))
+        else:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        if not is_user_staff(self.request):
+            results = results.filter(file__project__enable=True)
+        if query_type == "gene_names":
+            # stored gene names hold several symbols in any case, match them token by token
+            wanted = normalize_gene_symbols(" ".join(query))
+            candidates = Q(pk__in=[])
+            for symbol in wanted:
+                candidates |= Q(gene_names__icontains=symbol)
+            gene_maps = GeneNameMap.objects.filter(candidates, pk__in=results.values("gene_names_id"))
+            gene_ids = [pk for pk, gene_names in gene_maps.values_list("id", "gene_names")
+                        if not wanted.isdisjoint(normalize_gene_symbols(gene_names))]
+            results = results.filter(gene_names_id__in=gene_ids)
+            key = "gene_names__gene_names"
+        else:
+            results = results.filter(primary_id__in=query)
+            key = "primary_id"
+        samples = {}
+        grouped = {}
+        for k, primary_id, sample_id, sample_name, file_id, value in results.values_list(
+                key, "primary_id", "raw_sample_column_id", "raw_sample_column__name", "file_id", "value"):
+            samples[sample_id] = {"id": sample_id, "name": sample_name, "file": file_id}
+            grouped.setdefault(k, {}).setdefault(primary_id, {})[sample_id] = value
+        return Response({
+            "samples": sorted(samples.values(), key=lambda x: x["id"]),
+            "results": grouped
+        })
+
 
 
 
 class GeneNameMapViewSet(FiltersMixin, viewsets.ModelViewSet):
     queryset = GeneNameMap.objects.all()
     serializer_class = GeneNameMapSerializer
+    renderer_classes = data_renderer_classes
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ("id", "accession_id", "gene_names")
     ordering = ("id", "gene_names",)
@@ -764,11 +961,11 @@ class DataFilterListViewSet(FiltersMixin, viewsets.ModelViewSet):
         return Response(data=results, )
 
 
-class CurtainViewSet(FiltersMixin, viewsets.ModelViewSet):
+class CurtainViewSet(ConditionalRetrieveMixin, FiltersMixin, viewsets.ModelViewSet):
     queryset = Curtain.objects.all()
     serializer_class = CurtainSerializer
     filter_backends = [filters.OrderingFilter]
-    parser_classes = [MultiPartParser, JSONParser]
+    parser_classes = [MultiPartParser, JSONParser, JSONPatchParser]
     permission_classes = [(permissions.IsAdminUser|IsNonUserPostAllow|IsCurtainOwnerOrPublic),]
     lookup_field = 'link_id'
     ordering_fields = ("id", "created")
@@ -786,8 +983,48 @@ class CurtainViewSet(FiltersMixin, viewsets.ModelViewSet):
     @method_decorator(cache_page(0))
     def download(self, request, pk=None, link_id=None, token=None):
         c = self.get_object()
-        _, file_name = os.path.split(c.file.name)
-        return sendfile(request, c.file.name, attachment_filename=file_name)
+        last_modified = int(c.updated.timestamp())
+        # the ETag to send back in If-Match when patching the session
+        etag = curtain_session_etag(c) if c.blob_id else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = curtain_session_response(request, c, last_modified=last_modified, etag=etag)
+        response["Last-Modified"] = http_date(last_modified)
+        if etag:
+            response["ETag"] = etag
+        return response
+
+    @action(methods=["get"], url_path="sections/?token=(?P<token>[^/]*)", detail=True, permission_classes=[
+        permissions.IsAdminUser | HasCurtainToken | IsCurtainOwnerOrPublic
+    ])
+    @method_decorator(cache_page(0))
+    def sections(self, request, pk=None, link_id=None, token=None):
+        """
+        Manifest of the top level sections of the session, content_hash changes whenever the session does.
+        """
+        c = self.get_object()
+        sections = get_curtain_sections(c)
+        return Response(data={
+            "link_id": c.link_id,
+            "content_hash": c.blob.content_hash,
+            "sections": [{"name": s.name, "size": s.size} for s in sections]
+        })
+
+    @action(methods=["get"], url_path="sections/(?P<section>[^/]+)/?token=(?P<token>[^/]*)", detail=True,
+            permission_classes=[permissions.IsAdminUser | HasCurtainToken | IsCurtainOwnerOrPublic])
+    @method_decorator(cache_page(0))
+    def section(self, request, pk=None, link_id=None, section=None, token=None):
+        c = self.get_object()
+        s = next((s for s in get_curtain_sections(c) if s.name == section), None)
+        if s is None:
+            raise Http404
+        # sections of a blob never change so the blob hash identifies the content
+        etag = f'"{c.blob.content_hash}-{s.position}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = compressed_json_response(request, s.file, f"{s.name}.json", etag=etag)
+        response["ETag"] = etag
+        return response
 
     @action(methods=["post"], detail=True, permission_classes=[permissions.IsAdminUser | IsCurtainOwner])
     def generate_token(self, request, pk=None, link_id=None):
@@ -801,18 +1038,21 @@ class CurtainViewSet(FiltersMixin, viewsets.ModelViewSet):
 
     def create(self, request, **kwargs):
         c = Curtain()
-        c.file.save(str(c.link_id)+".json", djangoFile(self.request.data["file"]))
-        if "description" in self.request.data:
-            c.description = self.request.data["description"]
+        save_curtain_session(c, self.request.data["file"])
+        return self.complete_curtain_create(request, c, self.request.data)
+
+    def complete_curtain_create(self, request, c, data):
+        if "description" in data:
+            c.description = data["description"]
         if type(self.request.user) != AnonymousUser:
             c.owners.add(self.request.user)
-        if "enable" in self.request.data:
-            if self.request.data["enable"] == "True":
+        if "enable" in data:
+            if data["enable"] == "True":
                 c.enable = True
             else:
                 c.enable = False
-        if "curtain_type" in self.request.data:
-            c.curtain_type = self.request.data["curtain_type"]
+        if "curtain_type" in data:
+            c.curtain_type = data["curtain_type"]
         c.save()
         curtain_json = CurtainSerializer(c, many=False, context={"request": request})
         if type(self.request.user) != AnonymousUser:
@@ -827,21 +1067,115 @@ class CurtainViewSet(FiltersMixin, viewsets.ModelViewSet):
 
     def update(self, request, *args, **kwargs):
         c = self.get_object()
+        if "file" in self.request.data:
+            save_curtain_session(c, self.request.data["file"])
+        return self.complete_curtain_update(request, c, self.request.data)
 
-        if "enable" in self.request.data:
-            if self.request.data["enable"] == "True":
+    def partial_update(self, request, *args, **kwargs):
+        if request.content_type.split(";")[0].strip() != JSONPatchParser.media_type:
+            return super().partial_update(request, *args, **kwargs)
+        c = self.get_object()
+        if_match = request.META.get("HTTP_IF_MATCH")
+        # the ETag of a GET on this url is accepted as well as the one of the session download
+        c = patch_curtain_session(c, request.data, None if if_match is None else parse_etags(if_match),
+                                  get_etags=lambda locked: [self.get_etag(request, locked)])
+        curtain_json = CurtainSerializer(c, many=False, context={"request": request})
+        response = Response(data=curtain_json.data)
+        response["ETag"] = curtain_session_etag(c)
+        return response
+
+    def complete_curtain_update(self, request, c, data):
+        if "enable" in data:
+            if data["enable"] == "True":
                 c.enable = True
             else:
                 c.enable = False
-
-        if "file" in self.request.data:
-            c.file.save(str(c.link_id) + ".json", djangoFile(self.request.data["file"]))
-        if "description" in self.request.data:
-            c.description = self.request.data["description"]
+        if "description" in data:
+            c.description = data["description"]
         c.save()
         curtain_json = CurtainSerializer(c, many=False, context={"request": request})
         return Response(data=curtain_json.data)
 
+    def get_curtain_upload(self, request, upload_id):
+        upload = CurtainUpload.objects.filter(upload_id=upload_id).first()
+        # uploads are only visible to the user that started them
+        if not upload or upload.user_id != (request.user.id if request.user.is_authenticated else None):
+            raise Http404
+        return upload
+
+    @action(methods=["post"], detail=False, url_path="upload", parser_classes=[JSONParser])
+    def upload_init(self, request):
+        """
+        Start a chunked upload of a session. A link_id starts an upload replacing the session of that curtain.
+        """
+        curtain = None
+        if request.data.get("link_id"):
+            curtain = Curtain.objects.filter(link_id=request.data["link_id"]).first()
+            if not curtain:
+                raise Http404
+            if not (permissions.IsAdminUser | IsCurtainOwner)().has_object_permission(request, self, curtain):
+                self.permission_denied(request)
+        elif not request.user.is_authenticated and not settings.CURTAIN_ALLOW_NON_USER_POST:
+            self.permission_denied(request)
+        size = request.data.get("size")
+        if size is not None and (not str(size).isdigit()):
+            return Response(data={"size": "Size must be a non negative integer."}, status=status.HTTP_400_BAD_REQUEST)
+        upload = create_curtain_upload(
+            request.user if request.user.is_authenticated else None, curtain,
+            None if size is None else int(size), request.data.get("sha256", "")
+        )
+        return Response(data={"upload_id": str(upload.upload_id), "offset": upload.offset},
+                        status=status.HTTP_201_CREATED)
+
+    @action(methods=["get", "put"], detail=False, url_path=r"upload/(?P<upload_id>[0-9a-f-]+)")
+    def upload_chunk(self, request, upload_id=None):
+        """
+        GET returns the offset to resume from, PUT appends the raw request body at ?offset=.
+        """
+        upload = self.get_curtain_upload(request, upload_id)
+        if request.method == "PUT":
+            offset = request.query_params.get("offset", str(upload.offset))
+            if not offset.isdigit():
+                return Response(data={"offset": "Offset must be a non negative integer."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            # the body is read from the stream in chunks instead of being parsed into memory
+            upload = append_curtain_upload_chunk(upload, int(offset), request.stream)
+        return Response(data={"upload_id": str(upload.upload_id), "offset": upload.offset, "size": upload.size})
+
+    @action(methods=["post"], detail=False, url_path=r"upload/(?P<upload_id>[0-9a-f-]+)/finalize",
+            parser_classes=[JSONParser])
+    def upload_finalize(self, request, upload_id=None):
+        upload = self.get_curtain_upload(request, upload_id)
+        c = upload.curtain
+        # a reused blob stays locked until the curtain points at it
+        with transaction.atomic():
+            blob = finalize_curtain_upload(upload, request.data.get("sha256", ""))
+            if c:
+                set_curtain_blob(c, blob)
+                return self.complete_curtain_update(request, c, request.data)
+            c = Curtain()
+            set_curtain_blob(c, blob)
+            return self.complete_curtain_create(request, c, request.data)
+
+    @action(methods=["get"], detail=True, permission_classes=[permissions.IsAdminUser | IsCurtainOwner])
+    def versions(self, request, pk=None, link_id=None):
+        c = self.get_object()
+        versions_json = CurtainVersionSerializer(c.versions.all(), many=True)
+        return Response(data={"link_id": c.link_id, "versions": versions_json.data})
+
+    @action(methods=["post"], detail=True, url_path=r"versions/(?P<version>\d+)/restore",
+            permission_classes=[permissions.IsAdminUser | IsCurtainOwner])
+    def restore_version(self, request, pk=None, link_id=None, version=None):
+        c = self.get_object()
+        v = c.versions.filter(version=version).first()
+        if v is None:
+            raise Http404
+        c = restore_curtain_version(c, v)
+        curtain_json = CurtainSerializer(c, many=False, context={"request": request})
+        response = Response(data=curtain_json.data)
+        response["ETag"] = curtain_session_etag(c)
+        return response
+
     @action(methods=["get"], detail=True, permission_classes=[
         permissions.IsAdminUser | IsCurtainOwner
     ])
@@ -904,6 +1238,7 @@ class CurtainViewSet(FiltersMixin, viewsets.ModelViewSet):
 class KinaseLibraryViewSet(FiltersMixin, viewsets.ModelViewSet):
     queryset = KinaseLibraryModel.objects.all()
     serializer_class = KinaseLibrarySerializer
+    renderer_classes = data_renderer_classes
     permission_classes = [permissions.IsAuthenticatedOrReadOnly,]
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ("id", "entry")
@@ -917,32 +1252,49 @@ class KinaseLibraryViewSet(FiltersMixin, viewsets.ModelViewSet):
     filter_validation_schema = kinase_library_query_schema
 
 
-def update_section(section, data_array, model):
-    section.clear()
+def resolve_section_entries(model, data_array):
+    """
+    Resolve the entries of one related section in bulk. Entries with an id are looked up by id, entries with only a
+    name are looked up by exact name and created when missing, entries with an empty id are only matched by name.
+    """
+    ids = [ct["id"] for ct in data_array if ct.get("id")]
+    names = []
+    if any(f.name == "name" for f in model._meta.fields):
+        names = [ct["name"] for ct in data_array if not ct.get("id") and "name" in ct]
+    by_id = model.objects.in_bulk(ids)
+    missing_ids = set(ids) - set(by_id)
+    if missing_ids:
+        raise ValidationError({model._meta.model_name: f"unknown ids {sorted(missing_ids)}"})
+    by_name = {}
+    if names:
+        for entry in model.objects.filter(name__in=names).order_by("pk"):
+            by_name.setdefault(entry.name, entry)
+    created = {}
     for ct in data_array:
-        if "id" in ct:
-            if ct["id"]:
-                cell_type = model.objects.get(pk=ct["id"])
-                section.add(cell_type)
-            else:
-                if "name" in ct:
-                    cell_type = model.objects.filter(name__exact=ct["name"]).first()
-                    if cell_type:
-                        section.add(cell_type)
-                #cell_type = model(**ct)
-                #cell_type.save()
-                #section.add(cell_type)
-        else:
-            if "name" in ct:
-                cell_type = model.objects.filter(name__exact=ct["name"]).first()
-                if cell_type:
-                    section.add(cell_type)
-                else:
-                    cell_type = model(**ct)
-                    cell_type.save()
-                    section.add(cell_type)
-            #cell_type = model(**ct)
-            #cell_type.save()
-            #section.add(cell_type)
+        if "id" not in ct and ct.get("name") in names and ct["name"] not in by_name and ct["name"] not in created:
+            created[ct["name"]] = model(**ct)
+    by_name.update((entry.name, entry) for entry in model.objects.bulk_create(created.values()))
+
+    entries = []
+    for ct in data_array:
+        if ct.get("id"):
+            entries.append(by_id[ct["id"]])
+        elif "name" in ct and ct["name"] in by_name:
+            entries.append(by_name[ct["name"]])
+    return entries
+
+
+def update_section(section, data_array, model):
+    section.set(resolve_section_entries(model, data_array))
+
+
+def update_project_sections(project, data):
+    for field_name, model in PROJECT_SECTIONS.items():
+        if field_name not in data:
+            continue
+        # an empty first author list leaves the existing first authors in place
+        if field_name == "first_authors" and len(data[field_name]) == 0:
+            continue
+        update_section(getattr(project, field_name), data[field_name], model)
 
 
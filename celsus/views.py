@@ -22,8 +22,9 @@ from rest_framework import status
 from django_sendfile import sendfile
 from uniprotparser.betaparser import UniprotParser
 import requests as req
-from celsus.models import Project, GeneNameMap, UniprotRecord, SocialPlatform, ExtraProperties, DataFilterList
+from celsus.models import GeneNameMap, UniprotRecord, SocialPlatform, ExtraProperties, DataFilterList
 from celsus.serializers import DataFilterListSerializer
+from celsus.utils import get_overview_statistics
 from celsusdjango import settings
 from celsus.google_views import GoogleOAuth2AdapterIdToken # import custom adapter
 from dj_rest_auth.registration.views import SocialLoginView
@@ -100,39 +101,7 @@ class GetOverview(APIView):
     # user can access without being authenticated
 
     def get(self, request):
-        queryset = Project.objects.all()
-        total = queryset.count()
-        queryset_ptm = queryset.filter(ptm_data=1)
-        total_queryset_ptm = queryset_ptm.count()
-        unique_proteins_set = set()
-        for i in GeneNameMap.objects.all():
-            unique_proteins_set.add(i.gene_names)
-
-        ptm_unique_proteins = []
-        total_proteomics_unique_proteins = []
-
-        for i in queryset:
-            if i.ptm_data:
-                ptm_unique_proteins.append(len(i.get_unique_proteins()))
-            else:
-                total_proteomics_unique_proteins.append(len(i.get_unique_proteins()))
-
-        return Response(
-            {
-                "project_count": {
-                    "total": total,
-                    "total_proteomics": total-total_queryset_ptm,
-                    "ptm_proteomics": total_queryset_ptm
-                },
-                "unique_proteins": {
-                    "unique_proteins": len(unique_proteins_set),
-                    "average_unique_proteins": {
-                        "total_proteomics": sum(total_proteomics_unique_proteins)/len(total_proteomics_unique_proteins),
-                        "ptm_proteomics": sum(ptm_unique_proteins)/len(ptm_unique_proteins)
-                    }
-                }
-            }
-        )
+        return Response(get_overview_statistics())
 
 
 def refresh_uniprot():
@@ -57,7 +57,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'django.middleware.gzip.GZipMiddleware',
+    'celsus.middleware.RangeAwareGZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -211,8 +211,12 @@ SPECTACULAR_SETTINGS = {
     # OTHER SETTINGS
 }
 
-SENDFILE_BACKEND = "django_sendfile.backends.simple"
+# simple streams files through django, nginx (X-Accel-Redirect) and xsendfile (X-Sendfile) only emit headers
+# and leave the transfer to the web server in front of django
+SENDFILE_BACKEND = "django_sendfile.backends." + os.environ.get("DJANGO_SENDFILE_BACKEND", "simple")
 SENDFILE_ROOT = os.environ.get("DJANGO_MEDIA_ROOT", "D:/PycharmProjects/celsusdjango/media")
+# internal nginx location mapped onto SENDFILE_ROOT
+SENDFILE_URL = os.environ.get("DJANGO_SENDFILE_URL", "/protected-media")
 
 NETPHOS_WEB_URL = os.environ.get("NETPHOS_WEB_URL", "http://netphos:8000/api/netphos/predict")
 
@@ -323,6 +327,7 @@ if os.environ.get("WORKDB_PROFILE") == "production":
     ALLOWED_HOSTS = os.environ.get("DJANGO_ALLOWED_HOSTS", "http://localhost,http://127.0.0.1").split(",")
     CORS_ORIGIN_WHITELIST = os.environ.get("DJANGO_CORS_WHITELIST").split(",")
     MEDIA_ROOT = os.environ.get("DJANGO_MEDIA_ROOT")
+    SENDFILE_ROOT = MEDIA_ROOT
     DBBACKUP_STORAGE_OPTIONS = {'location': os.environ.get("DBBACKUP_STORAGE_LOCATION")}
     DBBACKUP_CONNECTORS = {
         'default': {
@@ -339,4 +344,11 @@ if os.environ.get("WORKDB_PROFILE") == "production":
             },
         },
     }
+    # shared between workers so that explicit cache invalidation reaches every process
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": f"redis://:{Q_CLUSTER['redis']['password']}@{Q_CLUSTER['redis']['host']}:{Q_CLUSTER['redis']['port']}/1",
+        }
+    }
 
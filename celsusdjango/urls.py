@@ -65,7 +65,7 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('logout/', LogoutView.as_view(), name='auth_logout'),
     path('csrf/', CSRFTokenView.as_view(), name="csrf_token"),
-    #path('overview/', GetOverview.as_view(), name="overview"),
+    path('overview/', GetOverview.as_view(), name="overview"),
     path('user/', UserView.as_view(), name="user"),
     #path('netphos/', NetPhosView.as_view(), name="netphos"),
     path('site-properties/', SitePropertiesView.as_view(), name="site_properties"),